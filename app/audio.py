@@ -1,8 +1,17 @@
-from threading import Lock
-from pydub import AudioSegment
 import io
+import mmap
+import os
+import struct
+import subprocess
+import time
+from bisect import bisect_right
+from collections import deque
+from functools import lru_cache
+from threading import Condition, Lock, Thread
+import numpy as np
+from pydub import AudioSegment
 
-from typing import TYPE_CHECKING
+from typing import Optional, TYPE_CHECKING
 
 if TYPE_CHECKING:
     pass
@@ -11,6 +20,10 @@ from app.logger import Logger
 
 logger = Logger().get_logger(__name__)
 
+PCM_FRAME_RATE = 16000
+PCM_SAMPLE_WIDTH = 2
+PCM_BYTES_PER_SEC = PCM_FRAME_RATE * PCM_SAMPLE_WIDTH
+
 
 class AudioRaw:
     def __init__(
@@ -31,15 +44,349 @@ class AudioRaw:
         )
 
 
+PCM_OVERFLOW_LOG_SEC = 10
+
+
+# Fixed-capacity PCM ring. head/tail are absolute stream byte offsets,
+# on overflow the oldest bytes are overwritten and counted in `dropped`.
+class PcmRingBuffer:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self.head = 0
+        self.tail = 0
+        # end of the write in progress, bytes before it minus capacity may
+        # be overwritten already
+        self.reserved = 0
+        self.dropped = 0
+        # overflows are logged once per PCM_OVERFLOW_LOG_SEC
+        self.dropped_logged = 0
+        self.next_overflow_log = 0.0
+
+    def __len__(self):
+        return self.tail - self.head
+
+    def write(self, data):
+        data = memoryview(data).cast("B")
+        if len(data) > self.capacity:
+            skip = len(data) - self.capacity
+            self.tail += skip
+            data = data[skip:]
+
+        self.reserved = self.tail + len(data)
+        pos = self.tail % self.capacity
+        first = min(len(data), self.capacity - pos)
+        self._view[pos : pos + first] = data[:first]
+        if first < len(data):
+            self._view[: len(data) - first] = data[first:]
+        self.tail += len(data)
+
+        if self.tail - self.head > self.capacity:
+            overflow = self.tail - self.head - self.capacity
+            self.dropped += overflow
+            self.head += overflow
+            now = time.monotonic()
+            if now >= self.next_overflow_log:
+                logger.warning(
+                    f"PcmRingBuffer overflow: dropped "
+                    f"{self.dropped - self.dropped_logged} bytes, {self.dropped} in total"
+                )
+                self.dropped_logged = self.dropped
+                self.next_overflow_log = now + PCM_OVERFLOW_LOG_SEC
+
+    def views(self, start=None, end=None) -> list[memoryview]:
+        # zero-copy: one view, or two when the range wraps around
+        start = self.head if start is None else max(start, self.head)
+        end = self.tail if end is None else min(end, self.tail)
+        return self._slices(start, end)
+
+    def _slices(self, start, end) -> list[memoryview]:
+        if end <= start:
+            return []
+
+        s, e = start % self.capacity, end % self.capacity
+        if s < e or e == 0:
+            return [self._view[s : e or self.capacity]]
+        return [self._view[s:], self._view[:e]]
+
+    def read(self, start=None, end=None) -> bytes:
+        return b"".join(self.views(start, end))
+
+    # copies [start, end) even after it was released, from another thread
+    # than the writer; None once the writer has wrapped over it
+    def copy(self, start, end) -> Optional[bytes]:
+        if self.reserved - self.capacity > start:
+            return None
+        data = b"".join(self._slices(start, min(end, self.tail)))
+        if self.reserved - self.capacity > start:
+            return None
+        return data
+
+    # accounts for bytes consumed elsewhere without copying them in
+    def skip(self, n):
+        self.tail += n
+        self.head = self.tail
+
+    def release(self, until):
+        self.head = min(max(self.head, until), self.tail)
+
+
+# Maps recording time (seconds, as in speaker events) to absolute byte offsets
+# of the PCM stream. Every audio websocket (re)connect adds a checkpoint from
+# its header `offset`; between checkpoints the PCM is assumed continuous.
+class StreamIndex:
+    def __init__(self):
+        self.checkpoints: list[tuple[float, int]] = []
+
+    def mark(self, ts: float, pos: int):
+        if self.checkpoints and ts < self.checkpoints[-1][0]:
+            logger.warning(f"StreamIndex: non-monotonic offset {ts}")
+            return
+        self.checkpoints.append((ts, pos))
+
+    def pos_at(self, ts: float) -> Optional[int]:
+        if not self.checkpoints:
+            return None
+
+        i = bisect_right(self.checkpoints, ts, key=lambda c: c[0]) - 1
+        if i < 0:
+            return self.checkpoints[0][1]
+
+        base_ts, base_pos = self.checkpoints[i]
+        pos = base_pos + round((ts - base_ts) * PCM_FRAME_RATE) * PCM_SAMPLE_WIDTH
+        if i + 1 < len(self.checkpoints):
+            pos = min(pos, self.checkpoints[i + 1][1])
+        return pos
+
+
 class AudioConverter:
     def __init__(self, audio):
         self.audio = audio
 
-    def convert(self, out_format):
-        return self.audio.export(format=out_format).read()
+    def convert(self, out_format, bitrate=None):
+        return self.audio.export(format=out_format, bitrate=bitrate).read()
+
+    def convert_to_opus(self, bitrate=None):
+        return self.convert(out_format="opus", bitrate=bitrate)
+
+    @staticmethod
+    def encode(
+        pcm_views,
+        profile: "EncodingProfile",
+        encoder: Optional["OpusStreamEncoder"] = None,
+    ) -> "EncodedAudio":
+        started = time.perf_counter()
+        pcm_bytes = sum(len(v) for v in pcm_views)
+
+        if profile.sample_rate != PCM_FRAME_RATE:
+            pcm_views = [resample_pcm(pcm_views, profile.sample_rate)]
+
+        payload = None
+        if profile.audio_format == LPCM_FORMAT:
+            payload = b"".join(pcm_views)
+        elif encoder is not None:
+            try:
+                payload = encoder.encode(pcm_views)
+            except Exception as e:
+                logger.error(f"stream encoder failed, falling back to pydub: {e}")
+
+        if payload is None:
+            audio_raw = AudioRaw(b"".join(pcm_views), frame_rate=profile.sample_rate)
+            payload = AudioConverter(audio_raw.get()).convert_to_opus(
+                bitrate=profile.bitrate
+            )
+
+        encoded = EncodedAudio(
+            payload=payload,
+            profile=profile,
+            pcm_bytes=pcm_bytes,
+            encode_sec=time.perf_counter() - started,
+        )
+        _encoding_stats.add(encoded)
+        return encoded
+
+
+OPUS_ENCODER_BITRATE = "24k"
+OPUS_ENCODER_WAIT_SEC = 10.0
+
+
+# ffmpeg reads PCM from stdin and writes Ogg/Opus to stdout. Its demuxer,
+# the Opus lookahead and the Ogg muxer all hold audio back until more input
+# or EOF arrives, so every segment gets its own process that is flushed by
+# closing stdin. One process per stream is kept started ahead: the spawn
+# overlaps the wait for the next segment and nothing touches the disk.
+class OpusStreamEncoder:
+    def __init__(
+        self, ffmpeg_path=None, bitrate=OPUS_ENCODER_BITRATE, input_rate=PCM_FRAME_RATE
+    ):
+        self.ffmpeg_path = ffmpeg_path or os.environ.get("FFMPEG_PATH", "ffmpeg")
+        self.bitrate = bitrate
+        self.input_rate = input_rate
+
+        self.mutex = Lock()
+        self.proc: Optional[subprocess.Popen] = None
+        self.closed = False
+
+    def _spawn(self) -> subprocess.Popen:
+        return subprocess.Popen(
+            [
+                self.ffmpeg_path,
+                "-loglevel", "error",
+                "-f", "s16le",
+                "-ar", str(self.input_rate),
+                "-ac", "1",
+                "-i", "pipe:0",
+                "-c:a", "libopus",
+                "-b:a", self.bitrate,
+                "-application", "voip",
+                "-frame_duration", "20",
+                "-f", "ogg",
+                "pipe:1",
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+
+    # the process started ahead, or a new one if it died meanwhile
+    def _take(self) -> subprocess.Popen:
+        with self.mutex:
+            proc, self.proc = self.proc, None
+        if proc is None or proc.poll() is not None:
+            proc = self._spawn()
+        return proc
+
+    def _prepare(self):
+        with self.mutex:
+            if self.closed or self.proc is not None:
+                return
+            self.proc = self._spawn()
+
+    def encode(self, pcm_views) -> bytes:
+        proc = self._take()
+        pcm = pcm_views[0] if len(pcm_views) == 1 else b"".join(pcm_views)
+        try:
+            payload, _ = proc.communicate(pcm, timeout=OPUS_ENCODER_WAIT_SEC)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            raise RuntimeError(f"opus encoder timed out on {len(pcm)} bytes")
+        finally:
+            self._prepare()
+
+        if proc.returncode != 0 or not payload:
+            raise RuntimeError(f"opus encoder exited with {proc.returncode}")
+        return payload
+
+    def close(self):
+        with self.mutex:
+            self.closed = True
+            proc, self.proc = self.proc, None
+        if proc is not None:
+            proc.kill()
+            proc.wait()
+
+
+LPCM_FORMAT = "lpcm"
+OGG_OPUS_FORMAT = "oggopus"
+
+
+class EncodingProfile:
+    def __init__(self, name, audio_format, sample_rate=PCM_FRAME_RATE, bitrate=None):
+        self.name = name
+        self.audio_format = audio_format
+        self.sample_rate = sample_rate
+        self.bitrate = bitrate
+
+    @property
+    def content_type(self) -> str:
+        if self.audio_format == LPCM_FORMAT:
+            return "application/octet-stream"
+        return "audio/ogg"
+
+    def __str__(self):
+        return self.name
+
+
+ENCODING_PROFILES = {
+    "lpcm": EncodingProfile("lpcm", LPCM_FORMAT),
+    "lpcm_8k": EncodingProfile("lpcm_8k", LPCM_FORMAT, sample_rate=8000),
+    "opus": EncodingProfile("opus", OGG_OPUS_FORMAT, bitrate=OPUS_ENCODER_BITRATE),
+    "opus_8k": EncodingProfile(
+        "opus_8k", OGG_OPUS_FORMAT, sample_rate=8000, bitrate="12k"
+    ),
+}
+
 
-    def convert_to_opus(self):
-        return self.convert(out_format="opus")
+# "opus", "lpcm_8k" or a profile with an explicit bitrate: "opus@16k"
+def encoding_profile(spec: str) -> EncodingProfile:
+    name, _, bitrate = spec.partition("@")
+    profile = ENCODING_PROFILES.get(name)
+    if profile is None:
+        raise Exception(f"Unknown encoding profile {spec}")
+    if not bitrate:
+        return profile
+    if profile.audio_format != OGG_OPUS_FORMAT:
+        raise Exception(f"bitrate is only supported for opus profiles: {spec}")
+    return EncodingProfile(spec, profile.audio_format, profile.sample_rate, bitrate)
+
+
+class EncodedAudio:
+    def __init__(self, payload: bytes, profile: EncodingProfile, pcm_bytes, encode_sec):
+        self.payload = payload
+        self.profile = profile
+        self.pcm_bytes = pcm_bytes
+        self.encode_sec = encode_sec
+
+
+class EncodingStats:
+    def __init__(self):
+        self.mutex = Lock()
+        self.by_profile: dict[str, dict] = {}
+
+    def add(self, encoded: EncodedAudio):
+        with self.mutex:
+            stats = self.by_profile.setdefault(
+                str(encoded.profile),
+                {"segments": 0, "pcm_bytes": 0, "payload_bytes": 0, "encode_sec": 0.0},
+            )
+            stats["segments"] += 1
+            stats["pcm_bytes"] += encoded.pcm_bytes
+            stats["payload_bytes"] += len(encoded.payload)
+            stats["encode_sec"] += encoded.encode_sec
+
+    def as_dict(self) -> dict:
+        with self.mutex:
+            return {name: dict(stats) for name, stats in self.by_profile.items()}
+
+
+_encoding_stats = EncodingStats()
+
+
+def encoding_stats() -> dict:
+    return _encoding_stats.as_dict()
+
+
+@lru_cache(maxsize=4)
+def _lowpass_kernel(factor, taps=31):
+    # windowed-sinc with the cutoff a bit below the new Nyquist frequency
+    cutoff = 0.45 / factor
+    n = np.arange(taps) - (taps - 1) / 2
+    kernel = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(taps)
+    return kernel / kernel.sum()
+
+
+def resample_pcm(pcm_views, rate) -> bytes:
+    if PCM_FRAME_RATE % rate != 0:
+        raise Exception(f"unsupported sample rate {rate}")
+    factor = PCM_FRAME_RATE // rate
+
+    samples = np.concatenate(
+        [np.frombuffer(v, dtype="<i2") for v in pcm_views] or [np.zeros(0, "<i2")]
+    ).astype(np.float32)
+    filtered = np.convolve(samples, _lowpass_kernel(factor), mode="same")[::factor]
+    return np.clip(np.rint(filtered), -32768, 32767).astype("<i2").tobytes()
 
 
 AUDIO_FILE_PREFIX = "output"
@@ -79,6 +426,223 @@ class AudioFileManager:
         return data
 
 
+
+AUDIO_ARCHIVE_CHUNK_BYTES = 1 << 20  # ~33 s of 16 kHz s16le
+AUDIO_ARCHIVE_ZSTD_LEVEL = 3
+_ARCHIVE_INDEX_RECORD = struct.Struct("<dQ")
+
+
+# Per-bot segmented recording: fixed-size PCM chunk files, an append-only
+# index of (recording ts, stream byte offset) checkpoints, and zstd
+# compression of every chunk once it is full. Range reads mmap only the
+# chunks they touch. Writes and marks are only queued by the caller (the
+# websocket loop), a writer thread does the file I/O.
+class AudioArchive:
+    def __init__(
+        self,
+        bot_id,
+        root=AUDIO_FILE_PREFIX,
+        chunk_bytes=AUDIO_ARCHIVE_CHUNK_BYTES,
+        zstd_level=AUDIO_ARCHIVE_ZSTD_LEVEL,
+    ):
+        self.dir = os.path.join(root, str(bot_id))
+        self.chunk_bytes = chunk_bytes
+        self.zstd_level = zstd_level
+        self.mutex = Lock()
+        self.index = StreamIndex()
+        self.compressing: list[Thread] = []
+        self._cache: Optional[tuple[int, bytes]] = None
+
+        os.makedirs(self.dir, exist_ok=True)
+        self.written = self._restore()
+        self._file = open(self._raw_path(self.written // self.chunk_bytes), "ab")
+        self._index_file = open(self._index_path(), "ab")
+
+        # PCM bytes and (ts, pos) index records waiting for the writer
+        self.cond = Condition()
+        self.pending: deque = deque()
+        self.accepted = self.written
+        self.writing = False
+        self.closed = False
+        self.writer = Thread(target=self._write_loop, name="audio-archive", daemon=True)
+        self.writer.start()
+
+    def _index_path(self):
+        return os.path.join(self.dir, "index")
+
+    def _raw_path(self, num):
+        return os.path.join(self.dir, f"{num:06d}.pcm")
+
+    def _zst_path(self, num):
+        return os.path.join(self.dir, f"{num:06d}.zst")
+
+    def _restore(self) -> int:
+        if os.path.exists(self._index_path()):
+            with open(self._index_path(), "rb") as f:
+                data = f.read()
+            usable = len(data) - len(data) % _ARCHIVE_INDEX_RECORD.size
+            for ts, pos in _ARCHIVE_INDEX_RECORD.iter_unpack(data[:usable]):
+                self.index.mark(ts, pos)
+
+        nums = sorted(
+            int(name.split(".")[0])
+            for name in os.listdir(self.dir)
+            if name.endswith((".pcm", ".zst"))
+        )
+        if not nums:
+            return 0
+
+        last = nums[-1]
+        if os.path.exists(self._raw_path(last)):
+            return last * self.chunk_bytes + os.path.getsize(self._raw_path(last))
+        return (last + 1) * self.chunk_bytes
+
+    def mark(self, ts: float):
+        with self.cond:
+            pos = self.accepted
+            self.pending.append((ts, pos))
+            self.cond.notify()
+        with self.mutex:
+            self.index.mark(ts, pos)
+
+    def write(self, pcm):
+        data = bytes(pcm)
+        with self.cond:
+            self.pending.append(data)
+            self.accepted += len(data)
+            self.cond.notify()
+
+    def _write_loop(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.closed:
+                    self.cond.wait()
+                if not self.pending:
+                    return
+                batch = list(self.pending)
+                self.pending.clear()
+                self.writing = True
+
+            try:
+                with self.mutex:
+                    for item in batch:
+                        if isinstance(item, tuple):
+                            self._index_file.write(_ARCHIVE_INDEX_RECORD.pack(*item))
+                        else:
+                            self._write(memoryview(item))
+                    self._index_file.flush()
+            except Exception as e:
+                logger.error(f"AudioArchive: failed to write {self.dir}: {e}")
+
+            with self.cond:
+                self.writing = False
+                self.cond.notify_all()
+
+    def _write(self, data: memoryview):
+        while len(data) > 0:
+            room = self.chunk_bytes - self.written % self.chunk_bytes
+            self._file.write(data[:room])
+            self.written += min(room, len(data))
+            data = data[room:]
+
+            if self.written % self.chunk_bytes == 0:
+                self._rotate()
+
+    # waits until everything queued so far is written
+    def _drain(self):
+        with self.cond:
+            self.cond.wait_for(lambda: not self.pending and not self.writing)
+
+    def _rotate(self):
+        self._file.close()
+        num = self.written // self.chunk_bytes - 1
+        worker = Thread(target=self._compress, args=(num,), daemon=True)
+        worker.start()
+        self.compressing = [t for t in self.compressing if t.is_alive()] + [worker]
+        self._file = open(self._raw_path(num + 1), "ab")
+
+    def _compress(self, num):
+        import zstandard
+
+        raw_path, zst_path = self._raw_path(num), self._zst_path(num)
+        try:
+            with open(raw_path, "rb") as f:
+                compressed = zstandard.ZstdCompressor(
+                    level=self.zstd_level, write_content_size=True
+                ).compress(f.read())
+            with open(f"{zst_path}.tmp", "wb") as f:
+                f.write(compressed)
+            with self.mutex:
+                os.replace(f"{zst_path}.tmp", zst_path)
+                os.remove(raw_path)
+        except Exception as e:
+            logger.error(f"AudioArchive: failed to compress chunk {num}: {e}")
+
+    def _decompressed(self, num) -> bytes:
+        if self._cache is not None and self._cache[0] == num:
+            return self._cache[1]
+
+        import zstandard
+
+        with open(self._zst_path(num), "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                data = zstandard.ZstdDecompressor().decompress(mm)
+        self._cache = (num, data)
+        return data
+
+    def _read_raw(self, num, start, end) -> bytes:
+        with open(self._raw_path(num), "rb") as f:
+            # a chunk just rotated in is empty, mmap refuses size 0
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return mm[start:end]
+
+    # reads [start, end) of absolute stream bytes
+    def read_range(self, start, end) -> bytes:
+        self._drain()
+        parts = []
+        with self.mutex:
+            self._file.flush()
+            pos, end = max(0, start), min(end, self.written)
+            while pos < end:
+                num = pos // self.chunk_bytes
+                chunk_start = num * self.chunk_bytes
+                a = pos - chunk_start
+                b = min(end - chunk_start, self.chunk_bytes)
+
+                if os.path.exists(self._zst_path(num)):
+                    parts.append(self._decompressed(num)[a:b])
+                elif os.path.exists(self._raw_path(num)):
+                    parts.append(self._read_raw(num, a, b))
+                else:
+                    logger.error(f"AudioArchive: chunk {num} is missing")
+                    break
+                pos = chunk_start + b
+
+        return b"".join(parts)
+
+    # reads [start_ts, end_ts) of recording time
+    def read(self, start_ts: float, end_ts: float) -> bytes:
+        with self.mutex:
+            start = self.index.pos_at(start_ts)
+            end = self.index.pos_at(end_ts)
+        if start is None or end is None:
+            return b""
+        return self.read_range(start, end)
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.writer.join()
+        with self.mutex:
+            self._file.close()
+            self._index_file.close()
+        for worker in self.compressing:
+            worker.join()
+
+
 """
 class AuidoManager:
     def __init__(self, bot_id):
@@ -75,12 +75,57 @@ class EnvConfig:
         self.SUMM_TRANSFER_TEMP = int("0")
         self.SUMM_CLEANER_TEMP = int("0")
 
+        self.SPEECH_KIT_STREAMING = (
+            self.__class__.env_or_default("SPEECH_KIT_STREAMING", "0") == "1"
+        )
+        self.SPEECH_KIT_GRPC_ENDPOINT = self.__class__.env_or_default(
+            "SPEECH_KIT_GRPC_ENDPOINT", "stt.api.cloud.yandex.net:443"
+        )
+        # 0 for a local stand-in server without TLS
+        self.SPEECH_KIT_GRPC_SECURE = (
+            self.__class__.env_or_default("SPEECH_KIT_GRPC_SECURE", "1") == "1"
+        )
+        self.STT_WORKERS = int(self.__class__.env_or_default("STT_WORKERS", "4"))
+        self.STT_QUEUE_SIZE = int(self.__class__.env_or_default("STT_QUEUE_SIZE", "8"))
+        self.STT_OVERFLOW_POLICY = self.__class__.env_or_default(
+            "STT_OVERFLOW_POLICY", "coalesce"
+        )
+        # SpeechKit sync recognition quota, requests per second
+        self.STT_RATE_LIMIT = float(
+            self.__class__.env_or_default("STT_RATE_LIMIT", "20")
+        )
+        self.STT_RATE_BURST = float(
+            self.__class__.env_or_default("STT_RATE_BURST", "20")
+        )
+        # empty disables recording of meeting audio
+        self.AUDIO_ARCHIVE_DIR = self.__class__.env_or_default("AUDIO_ARCHIVE_DIR", None)
+        # lpcm, lpcm_8k, opus, opus_8k; opus bitrate as in "opus@16k"
+        self.STT_AUDIO_PROFILE = self.__class__.env_or_default(
+            "STT_AUDIO_PROFILE", "opus"
+        )
+        # yandex or vosk, vosk runs offline on STT_MODEL_PATH
+        self.STT_BACKEND = self.__class__.env_or_default("STT_BACKEND", "yandex")
+        self.STT_MODEL_PATH = self.__class__.env_or_default("STT_MODEL_PATH", None)
+        self.STT_LOCAL_WORKERS = int(
+            self.__class__.env_or_default("STT_LOCAL_WORKERS", "2")
+        )
+        # empty disables the transcript logs bots are restored from
+        self.TRANSCRIPT_LOG_DIR = self.__class__.env_or_default(
+            "TRANSCRIPT_LOG_DIR", None
+        )
+
     def env_or_panic(key: str):
         env = os.environ.get(key)
         if env == "" or env is None:
             raise Exception(f"{key} not set")
         return env
 
+    def env_or_default(key: str, default):
+        env = os.environ.get(key)
+        if env == "" or env is None:
+            return default
+        return env
+
 
 def make_bot_config(
     recall_api_token,
@@ -100,6 +145,20 @@ def make_bot_config(
     summ_transfer_prompt,
     summ_cleaner_prompt,
     summ_interval_sec,
+    speech_kit_streaming,
+    speech_kit_grpc_endpoint,
+    speech_kit_grpc_secure,
+    stt_workers,
+    stt_queue_size,
+    stt_overflow_policy,
+    stt_rate_limit,
+    stt_rate_burst,
+    audio_archive_dir,
+    stt_audio_profile,
+    stt_backend,
+    stt_model_path,
+    stt_local_workers,
+    transcript_log_dir,
 ) -> BotConfig:
     return {
         "RECALL_API_TOKEN": recall_api_token,
@@ -122,6 +181,20 @@ def make_bot_config(
         "SUMM_TRANSFER_PROMPT": summ_transfer_prompt,
         "SUMM_CLEANER_PROMPT": summ_cleaner_prompt,
         "SUMM_INTERVAL_SEC": summ_interval_sec,
+        "YA_SPEECH_KIT_STREAMING": speech_kit_streaming,
+        "YA_SPEECH_KIT_GRPC_ENDPOINT": speech_kit_grpc_endpoint,
+        "YA_SPEECH_KIT_GRPC_SECURE": speech_kit_grpc_secure,
+        "STT_WORKERS": stt_workers,
+        "STT_QUEUE_SIZE": stt_queue_size,
+        "STT_OVERFLOW_POLICY": stt_overflow_policy,
+        "STT_RATE_LIMIT": stt_rate_limit,
+        "STT_RATE_BURST": stt_rate_burst,
+        "AUDIO_ARCHIVE_DIR": audio_archive_dir,
+        "STT_AUDIO_PROFILE": stt_audio_profile,
+        "STT_BACKEND": stt_backend,
+        "STT_MODEL_PATH": stt_model_path,
+        "STT_LOCAL_WORKERS": stt_local_workers,
+        "TRANSCRIPT_LOG_DIR": transcript_log_dir,
     }
 
 
@@ -157,6 +230,20 @@ class Config:
                 summ_cleaner_temp=env.SUMM_CLEANER_TEMP,
                 summ_cleaner_prompt=prompts.CLEAN_SUMMARIZATION_WITH_DETAIL,
                 summ_interval_sec=env.SUMMARY_INTERVAL,
+                speech_kit_streaming=env.SPEECH_KIT_STREAMING,
+                speech_kit_grpc_endpoint=env.SPEECH_KIT_GRPC_ENDPOINT,
+                speech_kit_grpc_secure=env.SPEECH_KIT_GRPC_SECURE,
+                stt_workers=env.STT_WORKERS,
+                stt_queue_size=env.STT_QUEUE_SIZE,
+                stt_overflow_policy=env.STT_OVERFLOW_POLICY,
+                stt_rate_limit=env.STT_RATE_LIMIT,
+                stt_rate_burst=env.STT_RATE_BURST,
+                audio_archive_dir=env.AUDIO_ARCHIVE_DIR,
+                stt_audio_profile=env.STT_AUDIO_PROFILE,
+                stt_backend=env.STT_BACKEND,
+                stt_model_path=env.STT_MODEL_PATH,
+                stt_local_workers=env.STT_LOCAL_WORKERS,
+                transcript_log_dir=env.TRANSCRIPT_LOG_DIR,
             )
             cls._system_prompts = prompts
 
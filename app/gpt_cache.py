@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+
+from .logger import Logger
+
+logger = Logger().get_logger(__name__)
+
+GPT_CACHE_SIZE = "GPT_CACHE_SIZE"
+GPT_CACHE_MAX_CHARS = "GPT_CACHE_MAX_CHARS"
+GPT_CACHE_TTL_SEC = "GPT_CACHE_TTL_SEC"
+# empty keeps the cache in memory only
+GPT_CACHE_DIR = "GPT_CACHE_DIR"
+GPT_CACHE_DISK_MAX_BYTES = "GPT_CACHE_DISK_MAX_BYTES"
+GPT_CACHE_SWEEP_SEC = 10 * 60
+# "1" caches every request, by default only temperature 0 ones are
+# deterministic enough to be served again
+GPT_CACHE_ALL = "GPT_CACHE_ALL"
+
+
+# Completion cache keyed by a hash of the whole request body (model,
+# completion options and messages). Entries live in an in-memory LRU bounded
+# by count and total text size, and optionally in files under `disk_dir`
+# that survive restarts; both tiers expire entries after `ttl_sec`. The disk
+# tier is swept every GPT_CACHE_SWEEP_SEC and whenever it outgrows
+# `disk_max_bytes`: expired files go first, then the oldest ones.
+class GptCache:
+    def __init__(
+        self,
+        max_entries=1024,
+        max_chars=8 << 20,
+        ttl_sec=24 * 60 * 60,
+        disk_dir: Optional[str] = None,
+        disk_max_bytes=256 << 20,
+        cache_all=False,
+    ):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.ttl_sec = ttl_sec
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.cache_all = cache_all
+
+        self.mutex = Lock()
+        # key -> (expires_at, text)
+        self.entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self.chars = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+
+        self.sweep_mutex = Lock()
+        self.disk_bytes = 0
+        self.next_sweep = 0.0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._sweep(time.time())
+
+    @staticmethod
+    def from_env() -> "GptCache":
+        env = os.environ
+        return GptCache(
+            max_entries=int(env.get(GPT_CACHE_SIZE) or 1024),
+            max_chars=int(env.get(GPT_CACHE_MAX_CHARS) or 8 << 20),
+            ttl_sec=float(env.get(GPT_CACHE_TTL_SEC) or 24 * 60 * 60),
+            disk_dir=env.get(GPT_CACHE_DIR) or None,
+            disk_max_bytes=int(env.get(GPT_CACHE_DISK_MAX_BYTES) or 256 << 20),
+            cache_all=env.get(GPT_CACHE_ALL) == "1",
+        )
+
+    def cacheable(self, request: dict) -> bool:
+        return self.cache_all or request["completionOptions"]["temperature"] == 0
+
+    @staticmethod
+    def key(request: dict) -> str:
+        body = json.dumps(request, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(body.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self.mutex:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                self._remove(key)
+
+        entry = self._disk_get(key, now)
+        with self.mutex:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        # keeps the expiry of the disk record
+        expires_at, text = entry
+        self._put_memory(key, text, expires_at)
+        return text
+
+    def put(self, key: str, text: str):
+        expires_at = time.time() + self.ttl_sec
+        self._put_memory(key, text, expires_at)
+        self._disk_put(key, text, expires_at)
+
+    def _put_memory(self, key, text, expires_at):
+        if len(text) > self.max_chars:
+            return
+        with self.mutex:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (expires_at, text)
+            self.chars += len(text)
+            while len(self.entries) > self.max_entries or self.chars > self.max_chars:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, text = self.entries.pop(key)
+        self.chars -= len(text)
+
+    def _disk_get(self, key, now) -> Optional[tuple[float, str]]:
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"GptCache: failed to read {key}: {e}")
+            return None
+
+        if entry["expires_at"] <= now:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            return None
+        return entry["expires_at"], entry["text"]
+
+    def _disk_put(self, key, text, expires_at):
+        if not self.disk_dir:
+            return
+        try:
+            # a temp file of its own, writers of one key may race
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"expires_at": expires_at, "text": text}, f, ensure_ascii=False)
+                size = f.tell()
+            os.replace(tmp_path, self._path(key))
+        except Exception as e:
+            logger.error(f"GptCache: failed to write {key}: {e}")
+            return
+
+        now = time.time()
+        with self.mutex:
+            self.disk_bytes += size
+            sweep = self.disk_bytes > self.disk_max_bytes or now >= self.next_sweep
+        if sweep:
+            self._sweep(now)
+
+    # a file written before now - ttl_sec has expired; temp files left by a
+    # crash age out the same way
+    def _sweep(self, now):
+        if not self.sweep_mutex.acquire(blocking=False):
+            return
+        try:
+            files = []
+            for entry in os.scandir(self.disk_dir):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+            files.sort()
+
+            total = sum(size for _, size, _ in files)
+            removed = 0
+            for mtime, size, path in files:
+                if mtime + self.ttl_sec > now and total <= self.disk_max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+
+            with self.mutex:
+                self.disk_bytes = total
+                self.disk_evictions += removed
+                self.next_sweep = now + GPT_CACHE_SWEEP_SEC
+        except Exception as e:
+            logger.error(f"GptCache: failed to sweep {self.disk_dir}: {e}")
+        finally:
+            self.sweep_mutex.release()
+
+    def stats(self) -> dict:
+        with self.mutex:
+            return {
+                "entries": len(self.entries),
+                "chars": self.chars,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_bytes": self.disk_bytes,
+                "disk_evictions": self.disk_evictions,
+            }
+
+
+_gpt_cache: Optional[GptCache] = None
+_gpt_cache_mutex = Lock()
+
+
+def gpt_cache() -> GptCache:
+    global _gpt_cache
+    with _gpt_cache_mutex:
+        if _gpt_cache is None:
+            _gpt_cache = GptCache.from_env()
+        return _gpt_cache
@@ -1,12 +1,25 @@
-import requests
 from typing import Optional
+from .gpt_cache import GptCache, gpt_cache
+from .http_client import http_client
 from .logger import Logger
+from .single_flight import SingleFlight
+from .tokens import (
+    estimate_tokens,
+    input_budget,
+    split_to_budget,
+    trim_to_budget,
+    GPT_MAX_OUTPUT_TOKENS,
+)
 
 from .db import ClickClient
 
 
 logger = Logger().get_logger(__name__)
 
+GPT_COMPLETION_URL = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
+# only complete answers are cached, truncated or filtered ones are retried
+GPT_FINAL_STATUS = "ALTERNATIVE_STATUS_FINAL"
+
 STOP_RESPONSES = [
     "простите",
     "я не понимаю о чем вы",
@@ -23,7 +36,7 @@ def gpt_req_sender(
     system_prompt: str,
     api_key: str,
     temperature: float,
-    max_tokens=2000,
+    max_tokens=GPT_MAX_OUTPUT_TOKENS,
 ):
     def inner(
         input_text: str,
@@ -32,10 +45,13 @@ def gpt_req_sender(
             input_text, model_uri, system_prompt, api_key, temperature, max_tokens
         )
 
+    # callers split longer inputs themselves, see Bot.make_summary
+    inner.input_budget = input_budget(system_prompt, max_tokens)
     return inner
 
 
 click_client = ClickClient()
+gpt_flight = SingleFlight()
 
 
 def send_request_to_gpt(
@@ -44,8 +60,17 @@ def send_request_to_gpt(
     system_prompt: str,
     api_key: str,
     temperature: float,
-    max_tokens=2000,
+    max_tokens=GPT_MAX_OUTPUT_TOKENS,
 ) -> Optional[str]:
+    budget = input_budget(system_prompt, max_tokens)
+    input_tokens = estimate_tokens(input_text)
+    if input_tokens > budget:
+        logger.warning(
+            f"send_request_to_gpt: input of ~{input_tokens} tokens "
+            f"trimmed to {budget}"
+        )
+        input_text = trim_to_budget(input_text, budget)
+
     prompt = {
         "modelUri": model_uri,
         "completionOptions": {
@@ -65,19 +90,38 @@ def send_request_to_gpt(
         ],
     }
 
-    url = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
+    cache = gpt_cache()
+    request_key = GptCache.key(prompt)
+    cache_key = request_key if cache.cacheable(prompt) else None
+    if cache_key is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"send_request_to_gpt: cache hit {cache_key[:12]}")
+            return cached
+
+    # identical requests in flight at the same time share one completion
+    return gpt_flight.do(
+        (request_key, api_key), lambda: _complete(prompt, api_key, cache_key)
+    )
+
+
+def _complete(prompt: dict, api_key: str, cache_key: Optional[str]) -> Optional[str]:
+    system_prompt = prompt["messages"][0]["text"]
+    input_text = prompt["messages"][1]["text"]
+
     headers = {
         "Content-Type": "application/json",
         "Authorization": api_key,
     }
 
-    response = requests.post(url, headers=headers, json=prompt)
+    response = http_client().post(GPT_COMPLETION_URL, headers=headers, json=prompt)
     logger.debug(f"send_request_to_gpt response: {response.json()}")
 
     try:
         resp_json = response.json()
         logger.info(resp_json)
-        resp_res = resp_json["result"]["alternatives"][0]["message"]["text"]
+        alternative = resp_json["result"]["alternatives"][0]
+        resp_res = alternative["message"]["text"]
     except Exception as e:
         logger.error(f"send_request_to_gpt: {e}")
         return None
@@ -96,6 +140,10 @@ def send_request_to_gpt(
             strs.append(str_to_clean)
 
     resp_res = ".".join(strs)
+    # callers take an empty answer for a failure, it is not served again
+    final = alternative.get("status") == GPT_FINAL_STATUS
+    if cache_key is not None and final and resp_res != "":
+        gpt_cache().put(cache_key, resp_res)
 
     try:
         click_client.insert_new_summaraize(system_prompt, input_text, resp_res)
@@ -103,3 +151,31 @@ def send_request_to_gpt(
         logger.error(f"failed to log into click: {e}")
 
     return resp_res
+
+
+# sends inputs over the budget piece by piece, the answers are joined
+def send_split_request_to_gpt(
+    input_text: str,
+    model_uri: str,
+    system_prompt: str,
+    api_key: str,
+    temperature: float,
+    max_tokens=GPT_MAX_OUTPUT_TOKENS,
+) -> Optional[str]:
+    pieces = split_to_budget(input_text, input_budget(system_prompt, max_tokens))
+    if len(pieces) <= 1:
+        return send_request_to_gpt(
+            input_text, model_uri, system_prompt, api_key, temperature, max_tokens
+        )
+
+    logger.info(f"send_split_request_to_gpt: input split into {len(pieces)} pieces")
+    results = [
+        send_request_to_gpt(
+            piece, model_uri, system_prompt, api_key, temperature, max_tokens
+        )
+        for piece in pieces
+    ]
+    results = [result for result in results if result]
+    if not results:
+        return None
+    return "\n".join(results)
@@ -3,7 +3,8 @@ from flask import Blueprint
 from flask import request, jsonify
 
 from ..config import Config
-from ..gpt_utils import send_request_to_gpt
+from ..gpt_utils import send_request_to_gpt, send_split_request_to_gpt
+from ..tokens import response_budget, GPT_MAX_OUTPUT_TOKENS
 from .utils import HttpException400, json_error
 from ..logger import Logger
 
@@ -34,6 +35,7 @@ def make_gpt_handler(config: Config):
         name_parent_endpoint: str,
         system_prompt: str,
         tokens_depends_on_req=False,
+        split_input=True,
     ):
         token = request[RequestFields.TOKEN_VALUE]
         if token != config.env.TOKEN:
@@ -43,13 +45,18 @@ def make_gpt_handler(config: Config):
         temperature = request[RequestFields.TEMPERATURE]
         logger.info(f"From {name_parent_endpoint}\nAccepted request {text}")
 
-        mindmap_text = send_request_to_gpt(
+        # answers to the pieces of a split input are joined with line breaks,
+        # a structured answer like a mind map is made from the trimmed input
+        send = send_split_request_to_gpt if split_input else send_request_to_gpt
+        mindmap_text = send(
             input_text=text,
             model_uri=model_uri,
             system_prompt=system_prompt,
             api_key=config.env.API_KEY,
             temperature=temperature,
-            max_tokens=(len(text) + 10 if tokens_depends_on_req else 2000),
+            max_tokens=(
+                response_budget(text) if tokens_depends_on_req else GPT_MAX_OUTPUT_TOKENS
+            ),
         )
 
         logger.info(f"Response from {name_parent_endpoint}: {mindmap_text}")
@@ -83,6 +90,7 @@ def make_gpt_handler(config: Config):
                 model_uri=config.env.MODEL_URI_GPT,
                 name_parent_endpoint=EndPoint.MIND_MAP,
                 system_prompt=config.prompts.MIND_MAP,
+                split_input=False,
             )
 
     @gpt_blueprint.route("/gpt/get-correcting-dialog", methods=["POST"])
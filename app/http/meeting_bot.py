@@ -1,3 +1,6 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from typing import Optional
 from strenum import StrEnum
 from flask import Blueprint
@@ -6,18 +9,28 @@ from flask import request, jsonify, Response
 from ..meeting_bots.roles import check_role, default_role
 
 from ..config import Config
-from ..gpt_utils import gpt_req_sender, send_request_to_gpt
+from ..gpt_utils import send_request_to_gpt
+from ..tokens import response_budget
 from .utils import json_error, HttpException400, error_resp, resp, test_mode
 from ..logger import Logger
 
 from ..meeting_bots import BotNet
 
 from ..utils import none_unpack
+from ..single_flight import SingleFlight
 
 from ..meeting_bots.bot import SummaryModel, SummaryRepo  # may be cyclic
 
 logger = Logger().get_logger(__name__)
 
+style_flight = SingleFlight()
+
+BATCH_GET_SUM_WORKERS = 8
+# shared by all /batch_get_sum requests, bounds their upstream calls at once
+batch_pool = ThreadPoolExecutor(
+    max_workers=BATCH_GET_SUM_WORKERS, thread_name_prefix="batch-get-sum"
+)
+
 
 # TODO: make method to tranform from summary_model
 def make_summ_response(summ: SummaryModel, **kwargs):
@@ -126,28 +139,8 @@ def make_bot_handler(config: Config, bot_net: BotNet) -> Blueprint:
     @bot_blueprint.route("/transcription", methods=["POST"])
     def get_trascription():
         with HttpException400(logger=logger) as http_e:
-            logger.info(f"webhook /transcription: {request.json}")
-
-            payload = request.json["data"]
-            bot_id = payload["bot_id"]
-            transcript = payload["transcript"]
-
-            from ..meeting_bots.bot import Transcription  # maybe cyclic
-
-            bot = bot_net.get_by_bot_id(bot_id=bot_id)
-            if bot is not None:
-                bot.add_transcription(Transcription.from_recall_resp(transcript))
-                return jsonify({"success": True})
-
-            bot = bot_net.try_restore_bot(
-                bot_id=bot_id,
-            )
-
-            if bot is None:
-                logger.error("No such bot")
-            else:
-                bot.add_transcription(Transcription.from_recall_resp(transcript))
-
+            # parsed and added by BotNet.transcript_ingest
+            bot_net.transcript_ingest.put(request.get_data())
             return jsonify({"success": True})
         return http_e.response
 
@@ -179,6 +172,13 @@ def make_bot_handler(config: Config, bot_net: BotNet) -> Blueprint:
             )
         return http_e.response
 
+    @bot_blueprint.route("/stats", methods=["GET"])
+    @test_mode
+    def stats():
+        with HttpException400(logger=logger) as http_e:
+            return jsonify(bot_net.stats())
+        return http_e.response
+
     @bot_blueprint.route("/batch_get_sum", methods=["POST"])
     @test_mode
     def batch_get_sum():
@@ -188,25 +188,55 @@ def make_bot_handler(config: Config, bot_net: BotNet) -> Blueprint:
                 return json_error(400, description="Request body must be JSON")
 
             summaries = request.json["summarizations"]
-            batch_resp: list[dict] = []
+            # with partial, items that failed or missed the deadline get an
+            # error entry in place instead of failing the whole batch; there
+            # is no deadline unless the caller sets one
+            partial = bool(request.json.get("partial", False))
+            deadline_sec = request.json.get("deadline_sec")
+            deadline = (
+                time.monotonic() + float(deadline_sec)
+                if deadline_sec is not None
+                else None
+            )
 
             for summary in summaries:
-                logger.info("for summary in summaries: %s", summary)
-                bot_id = summary.get("summ_id")
-                if not bot_id:
+                if not summary.get("summ_id"):
                     return json_error(400, description="summ_id is required")
 
-                role = summary.get("role", "")
-
-                r, status = get_summ_helper(
+            futures = [
+                batch_pool.submit(
+                    get_summ_helper,
                     summary_repo=bot_net.summary_repo,
-                    bot_id=bot_id,
-                    role=role,
+                    bot_id=summary["summ_id"],
+                    role=summary.get("role", ""),
                     config=config,
                 )
+                for summary in summaries
+            ]
+
+            batch_resp: list[dict] = []
+            for summary, future in zip(summaries, futures):
+                timeout = (
+                    max(0.0, deadline - time.monotonic()) if deadline is not None else None
+                )
+                try:
+                    r, status = future.result(timeout=timeout)
+                except FutureTimeoutError:
+                    # frees the worker if the item has not started yet
+                    future.cancel()
+                    r, status = error_resp(description="deadline exceeded"), 504
+                except Exception as e:
+                    logger.error("batch_get_sum %s: %s", summary["summ_id"], e)
+                    r, status = error_resp(), 400
 
                 if status != 200:
-                    return resp(r, status)
+                    if not partial:
+                        # items already running finish, the queued ones are
+                        # dropped
+                        for pending in futures:
+                            pending.cancel()
+                        return resp(r, status)
+                    r = {"id": summary["summ_id"], **r}
 
                 batch_resp.append(r)
 
@@ -231,17 +261,41 @@ def _get_summ_with_role(
     if role == summ_model["role"]:
         return _get_summ_previous_with_role(summ_model)
 
+    # viewers asking for the same role at once share one styling and save
+    new_rolled_summ_text = style_flight.do(
+        (summ_model["id"], role, summ_model["text"]),
+        lambda: _style_summ(summ_model, summary_repo, config, role),
+    )
+
+    if new_rolled_summ_text is None or new_rolled_summ_text == "":
+        logger.error("failed to style role for request")
+        return _get_summ_previous_best(summ_model)
+
+    return (
+        make_summ_response(
+            summ=summ_model,
+            has_summ=True,
+            summ_text=new_rolled_summ_text,
+            role=role,
+        ),
+        200,
+    )
+
+
+def _style_summ(
+    summ_model: SummaryModel, summary_repo: SummaryRepo, config: Config, role
+) -> Optional[str]:
     new_rolled_summ_text = send_request_to_gpt(
         summ_model["text"],
         config.env.MODEL_URI_GPT,
         config.prompts.STYLE(role),
         config.env.API_KEY,
         0,
+        max_tokens=response_budget(summ_model["text"], ratio=1.5, extra=100),
     )
 
     if new_rolled_summ_text is None or new_rolled_summ_text == "":
-        logger.error("failed to style role for request")
-        return _get_summ_previous_best(summ_model)
+        return new_rolled_summ_text
 
     # TODO:
     # make async (after response)
@@ -251,15 +305,7 @@ def _get_summ_with_role(
         bot_id=summ_model["id"], summary_with_role=new_rolled_summ_text, role=role
     )
 
-    return (
-        make_summ_response(
-            summ=summ_model,
-            has_summ=True,
-            summ_text=new_rolled_summ_text,
-            role=role,
-        ),
-        200,
-    )
+    return new_rolled_summ_text
 
 
 def _get_summ_previous(summ_model: SummaryModel) -> tuple[dict, int]:
@@ -0,0 +1,190 @@
+import asyncio
+import time
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from threading import Lock, Thread
+from typing import Optional
+from urllib.parse import urlsplit
+from weakref import WeakKeyDictionary
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from .logger import Logger
+
+logger = Logger().get_logger(__name__)
+
+HTTP_POOL_SIZE = 16
+
+
+class _HostStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.total_sec = 0.0
+        self.async_handshakes = 0
+
+    # httpcore trace hook of the async client
+    async def trace(self, event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            self.async_handshakes += 1
+
+
+# One keep-alive connection pool per host shared by all outbound calls
+# (GPT, SpeechKit, Recall, Notes API), so a request reuses an open TLS
+# connection instead of handshaking again. Async callers share one
+# httpx.AsyncClient per event loop, its connections are bound to the loop.
+# No session keeps cookies, a response of one caller must not change the
+# requests of another.
+class HttpClient:
+    def __init__(self, pool_size=HTTP_POOL_SIZE):
+        self.pool_size = pool_size
+        self.mutex = Lock()
+        self.sessions: dict[str, requests.Session] = {}
+        self.adapters: dict[str, HTTPAdapter] = {}
+        self.host_stats: dict[str, _HostStats] = {}
+        self.async_clients: WeakKeyDictionary[
+            asyncio.AbstractEventLoop, httpx.AsyncClient
+        ] = WeakKeyDictionary()
+
+    @staticmethod
+    def _host(url: str) -> str:
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def session(self, url: str) -> tuple[requests.Session, _HostStats]:
+        host = HttpClient._host(url)
+        with self.mutex:
+            session = self.sessions.get(host)
+            if session is None:
+                adapter = HTTPAdapter(
+                    pool_connections=1, pool_maxsize=self.pool_size, pool_block=False
+                )
+                session = requests.Session()
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                session.mount(host, adapter)
+                self.sessions[host] = session
+                self.adapters[host] = adapter
+            return session, self._host_stats(host)
+
+    def _host_stats(self, host: str) -> _HostStats:
+        stats = self.host_stats.get(host)
+        if stats is None:
+            stats = self.host_stats[host] = _HostStats()
+        return stats
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        session, stats = self.session(url)
+        start = time.monotonic()
+        try:
+            return session.request(method, url, **kwargs)
+        except Exception:
+            with self.mutex:
+                stats.errors += 1
+            raise
+        finally:
+            with self.mutex:
+                stats.requests += 1
+                stats.total_sec += time.monotonic() - start
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def _async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        with self.mutex:
+            client = self.async_clients.get(loop)
+            if client is None:
+                client = httpx.AsyncClient(
+                    cookies=CookieJar(DefaultCookiePolicy(allowed_domains=[])),
+                    limits=httpx.Limits(max_keepalive_connections=self.pool_size),
+                    # no timeout unless the caller sets one, like requests
+                    timeout=None,
+                )
+                self.async_clients[loop] = client
+            return client
+
+    async def arequest(self, method: str, url: str, **kwargs) -> httpx.Response:
+        client = self._async_client()
+        with self.mutex:
+            stats = self._host_stats(HttpClient._host(url))
+        start = time.monotonic()
+        try:
+            return await client.request(
+                method, url, extensions={"trace": stats.trace}, **kwargs
+            )
+        except Exception:
+            with self.mutex:
+                stats.errors += 1
+            raise
+        finally:
+            with self.mutex:
+                stats.requests += 1
+                stats.total_sec += time.monotonic() - start
+
+    async def aget(self, url: str, **kwargs) -> httpx.Response:
+        return await self.arequest("GET", url, **kwargs)
+
+    async def apost(self, url: str, **kwargs) -> httpx.Response:
+        return await self.arequest("POST", url, **kwargs)
+
+    # closes the async client of the running loop, before the loop stops
+    async def aclose(self):
+        with self.mutex:
+            client = self.async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    # opens `connections` connections to every host in the background, the
+    # status of the warm-up requests does not matter
+    def prewarm(self, urls: list[Optional[str]], connections=2):
+        def warm(url):
+            try:
+                self.request("HEAD", url, timeout=5)
+            except Exception as e:
+                logger.warning(f"HttpClient: failed to prewarm {url}: {e}")
+
+        hosts = {HttpClient._host(url) for url in urls if url}
+        for host in hosts:
+            for _ in range(connections):
+                Thread(target=warm, args=(host,), daemon=True).start()
+
+    def stats(self) -> dict:
+        stats = {}
+        with self.mutex:
+            for host, host_stats in self.host_stats.items():
+                adapter = self.adapters.get(host)
+                pools = adapter.poolmanager.pools if adapter is not None else {}
+                connections = [pools[key] for key in pools.keys()]
+                stats[host] = {
+                    "requests": host_stats.requests,
+                    "errors": host_stats.errors,
+                    "avg_sec": round(
+                        host_stats.total_sec / max(1, host_stats.requests), 3
+                    ),
+                    # every new connection costs a TCP (and TLS) handshake
+                    "handshakes": sum(pool.num_connections for pool in connections)
+                    + host_stats.async_handshakes,
+                    # open connections waiting in the pool, empty slots are None
+                    "idle": sum(
+                        conn is not None
+                        for pool in connections
+                        for conn in list(pool.pool.queue)
+                    ),
+                }
+        return stats
+
+
+_http_client: Optional[HttpClient] = None
+_http_client_mutex = Lock()
+
+
+def http_client() -> HttpClient:
+    global _http_client
+    with _http_client_mutex:
+        if _http_client is None:
+            _http_client = HttpClient()
+        return _http_client
@@ -0,0 +1,160 @@
+import json
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from threading import Condition, Thread
+from typing import Optional
+
+from .audio import LPCM_FORMAT, EncodingProfile, PCM_FRAME_RATE
+from .logger import Logger
+from .speach_kit import SpeechRecognizer
+
+logger = Logger().get_logger(__name__)
+
+LOCAL_STT_WORKERS = 2
+LOCAL_STT_BATCH = 8
+LOCAL_STT_BATCH_WAIT_SEC = 0.05
+# a caller gives up on a segment the pool did not recognize in time
+LOCAL_STT_TIMEOUT_SEC = 60
+
+# the model of the current pool process, loaded once by _init_worker
+_model = None
+
+
+def _init_worker(model_path: str):
+    global _model
+    from vosk import Model, SetLogLevel
+
+    SetLogLevel(-1)
+    _model = Model(model_path)
+
+
+def _recognize_batch(items: list[tuple[bytes, int]]) -> list[str]:
+    from vosk import KaldiRecognizer
+
+    texts = []
+    for pcm, sample_rate in items:
+        recognizer = KaldiRecognizer(_model, sample_rate)
+        recognizer.AcceptWaveform(pcm)
+        texts.append(json.loads(recognizer.FinalResult()).get("text", ""))
+    return texts
+
+
+# Offline Vosk (Kaldi) recognition on CPU. Every pool process loads the model
+# once; concurrent get() calls from the STT workers are grouped into batches
+# so a process handles several segments per round trip.
+class VoskSpeechToText(SpeechRecognizer):
+    pcm_only = True
+
+    def __init__(
+        self,
+        model_path: str,
+        workers=LOCAL_STT_WORKERS,
+        batch_size=LOCAL_STT_BATCH,
+        batch_wait_sec=LOCAL_STT_BATCH_WAIT_SEC,
+        timeout_sec=LOCAL_STT_TIMEOUT_SEC,
+    ):
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(model_path,)
+        )
+        self.batch_size = batch_size
+        self.batch_wait_sec = batch_wait_sec
+        self.timeout_sec = timeout_sec
+
+        self.cond = Condition()
+        self.pending: list[tuple[tuple[bytes, int], Future]] = []
+        self.stopped = False
+
+        self.batches = 0
+        self.segments = 0
+
+        self.batcher = Thread(target=self._batch_loop, name="vosk-batcher", daemon=True)
+        self.batcher.start()
+
+    @staticmethod
+    def _item(audio_data: bytes, profile: Optional[EncodingProfile]):
+        if profile is not None and profile.audio_format != LPCM_FORMAT:
+            raise ValueError(f"{profile.name} is not supported, use an lpcm profile")
+        return audio_data, profile.sample_rate if profile else PCM_FRAME_RATE
+
+    def get(
+        self, audio_data: bytes, profile: Optional[EncodingProfile] = None
+    ) -> Optional[str]:
+        return self.get_batch([(audio_data, profile)])[0]
+
+    def get_batch(
+        self, items: list[tuple[bytes, Optional[EncodingProfile]]]
+    ) -> list[Optional[str]]:
+        try:
+            futures = []
+            with self.cond:
+                for audio_data, profile in items:
+                    future = Future()
+                    self.pending.append((self._item(audio_data, profile), future))
+                    futures.append(future)
+                self.cond.notify()
+        except Exception as e:
+            logger.error("failed to get tr from Vosk: %s", e)
+            return [None] * len(items)
+
+        texts = []
+        for future in futures:
+            try:
+                texts.append(future.result(timeout=self.timeout_sec) or None)
+            except Exception as e:
+                logger.error("failed to get tr from Vosk: %s", e)
+                texts.append(None)
+        return texts
+
+    def _batch_loop(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.stopped:
+                    self.cond.wait()
+                if self.stopped:
+                    return
+                # give concurrent callers a moment to join the batch
+                if len(self.pending) < self.batch_size:
+                    self.cond.wait(self.batch_wait_sec)
+                batch = self.pending[: self.batch_size]
+                del self.pending[: self.batch_size]
+
+            self.batches += 1
+            self.segments += len(batch)
+            try:
+                result = self.pool.submit(_recognize_batch, [item for item, _ in batch])
+            except Exception as e:
+                VoskSpeechToText._fail(batch, e)
+                continue
+            result.add_done_callback(lambda result, batch=batch: self._resolve(result, batch))
+
+    @staticmethod
+    def _fail(batch, error: BaseException):
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    # runs in the pool's callback thread; a batch cancelled by close() must
+    # still resolve its items or the callers would wait for them forever
+    @staticmethod
+    def _resolve(result: Future, batch):
+        if result.cancelled():
+            VoskSpeechToText._fail(batch, CancelledError())
+            return
+        error = result.exception()
+        if error is not None:
+            VoskSpeechToText._fail(batch, error)
+            return
+        for (_, future), text in zip(batch, result.result()):
+            if not future.done():
+                future.set_result(text)
+
+    def close(self):
+        with self.cond:
+            self.stopped = True
+            for _, future in self.pending:
+                future.cancel()
+            self.pending = []
+            self.cond.notify()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {"batches": self.batches, "segments": self.segments}
@@ -1,13 +1,22 @@
-import re
 import json
-import requests
+import time
+from threading import Lock
 from .recall_api import RecallApi
 from ..logger import Logger
 from typing import Callable, Dict, TypedDict, Optional, Union
-from functools import reduce
-from ..speach_kit import YaSpeechToText
+from ..audio import EncodingProfile
+from ..speach_kit import SpeechRecognizer, YaStreamingSpeechToText
+from ..http_client import http_client
+from ..single_flight import SingleFlight
 from ..utils import wrap_http_err, HTTPStatusException
+from ..tokens import estimate_tokens, split_to_budget
+from .compaction import compact, count_merge, count_message
 from .platform_parser import platform_by_url, Platform
+from .segment_queue import OverflowPolicy, SEGMENT_QUEUE_SIZE
+from .flush_timer import FlushTimer
+from .transcript_log import TranscriptLog
+from .transcript_store import TranscriptStore
+from .stt_dispatcher import SttDispatcher
 
 logger = Logger().get_logger(__name__)
 
@@ -28,11 +37,7 @@ class Transcription(TypedDict):
 
         speaker = recall_resp_tr["speaker"]
         is_final = recall_resp_tr["is_final"]
-        message = reduce(
-            lambda text, new_part: f"{text}\n{new_part['text']}",
-            recall_resp_tr["words"],
-            "",
-        )[1:]
+        message = "\n".join(word["text"] for word in recall_resp_tr["words"])
 
         return Transcription(
             id=id,
@@ -42,53 +47,149 @@ class Transcription(TypedDict):
         )  # type: ignore
 
 
+# Transcriptions ordered by id with every message compacted once on add.
+# The final-only prompt of the entries before the first partial is cached
+# and extended as that prefix grows, consecutive turns of one speaker share
+# a single line; the entries from the first partial on may still change and
+# are rendered on every build. The cache is rebuilt from the compacted
+# messages only when an entry inside the prefix changed.
 class FullTranscription:
     def __init__(self):
-        self.t: Dict[int, SpeakerTranscription] = {}
+        self.store = TranscriptStore()
         self.summ = ""
-
-    def add(self, tr_id, sp: SpeakerTranscription):
-        self.t[tr_id] = sp
+        # bumped by every change of the final-only dialogue; tr_id -> the
+        # version its final text last changed at
+        self.version = 0
+        self.stamps: dict[int, int] = {}
+
+        # final-only prompt of the first `built` entries, all of them final,
+        # without the last line break
+        self.prompt = ""
+        self.last_speaker: Optional[int] = None
+        self.built = 0
+        self.stale = False
+
+        # transcriptions arrive from STT workers while the scheduler reads
+        self.mutex = Lock()
+
+    # False when the entry is dropped as a partial that arrived late;
+    # `count` is off for entries replayed from the transcript log
+    def add(self, tr_id, sp: SpeakerTranscription, count=True) -> bool:
+        message = compact(sp["message"])
+        with self.mutex:
+            pos = self.store.find(tr_id)
+            if pos >= 0 and self.store.is_final(pos) and not sp["is_final"]:
+                return False
+
+            was_final = pos >= 0 and self.store.is_final(pos)
+            pos = self.store.put(tr_id, sp["speaker"], sp["is_final"], message)
+            if pos < self.built:
+                self.stale = True
+            if sp["is_final"] or was_final:
+                self.version += 1
+                self.stamps[tr_id] = self.version
+
+        if count and sp["is_final"] and not was_final:
+            count_message(sp["message"], message)
+        return True
 
     def to_prompt(self, only_final=True) -> Optional[str]:
-        # self.t.update(sorted(self.t.items(), key=lambda item: item[1]))
-
-        prompt = ""
-        for tr_id in sorted(self.t):
-            tr_by_sp = self.t[tr_id]
-            if only_final and not tr_by_sp["is_final"]:
-                continue
-
-            # if 'Noise.' in tr_by_sp["message"]:
-            #    continue
+        summ, dialogue = self.dialogue(only_final)
+        if dialogue is None:
+            return None
+        return FullTranscription.with_summary(summ, dialogue)
 
-            # TODO: make copy of self.t[tr_id]
-            tr_by_sp["message"] = self.remove_word_any_regexp(
-                tr_by_sp["message"], "noise"
-            )
+    # the last summary and the dialogue after it
+    def dialogue(self, only_final=True) -> tuple[str, Optional[str]]:
+        with self.mutex:
+            return self.summ, self._dialogue(only_final)
 
-            new_part = f'{tr_by_sp["speaker"]}: {tr_by_sp["message"]}\n'
-            prompt = f"{prompt}{new_part}"
+    # the final-only dialogue with the version it reflects, see drop_to_summ
+    def snapshot(self) -> tuple[int, str, Optional[str]]:
+        with self.mutex:
+            return self.version, self.summ, self._dialogue(True)
 
-        if prompt == "":
-            return None
+    @staticmethod
+    def with_summary(summ: str, dialogue: str) -> str:
+        if summ == "":
+            return dialogue
 
-        if self.summ == "":
-            return prompt
+        return f"Вот начало диалога: {summ}, вот продолжение: {dialogue}"
 
-        final_prompt = f"Вот начало диалога: {self.summ}, вот продолжение: {prompt}"
+    # appends the entries in [start, end) to `prompt` that ends with
+    # `last_speaker`; merges are counted once, when a turn is cached
+    def _render(
+        self, prompt, last_speaker, start=0, end=None, only_final=True, count=False
+    ):
+        parts = [prompt]
+        for entry in self.store.entries(start, end):
+            if (only_final and not entry.is_final) or entry.message == "":
+                continue
 
-        return final_prompt
+            name = self.store.speaker_name(entry.speaker)
+            if entry.speaker == last_speaker:
+                parts.append(f" {entry.message}")
+                if count:
+                    count_merge(name)
+                continue
 
-    def drop_to_summ(self, summary: str):
-        self.summ = summary
-        self.t = {}
+            sep = "\n" if last_speaker is not None else ""
+            parts.append(f"{sep}{name}: {entry.message}")
+            last_speaker = entry.speaker
+        return "".join(parts), last_speaker
+
+    def _dialogue(self, only_final) -> Optional[str]:
+        if not only_final:
+            prompt, _ = self._render("", None, only_final=False)
+        else:
+            count = not self.stale
+            if self.stale:
+                self.prompt, self.last_speaker, self.built = "", None, 0
+                self.stale = False
+            end = self.store.first_partial(self.built)
+            if end > self.built:
+                self.prompt, self.last_speaker = self._render(
+                    self.prompt, self.last_speaker, self.built, end, count=count
+                )
+                self.built = end
+            prompt, _ = self._render(self.prompt, self.last_speaker, self.built)
 
-    def remove_word_any_regexp(self, inp, word) -> str:
-        def c(all_inp, word_inp):
-            return re.sub(word_inp, "", all_inp, flags=re.IGNORECASE)
+        if prompt == "":
+            return None
+        return f"{prompt}\n"
+
+    # drops what `summary` covers: every entry, or with `version` the finals
+    # not changed since that snapshot. Returns the entries that stay, the
+    # partials and what arrived while the summary was made.
+    def drop_to_summ(
+        self, summary: str, version: Optional[int] = None
+    ) -> list[tuple[int, SpeakerTranscription]]:
+        with self.mutex:
+            kept: list[tuple[int, SpeakerTranscription]] = []
+            if version is not None:
+                for entry in self.store.entries():
+                    if entry.is_final and self.stamps.get(entry.tr_id, 0) <= version:
+                        continue
+                    sp = SpeakerTranscription(
+                        message=entry.message,
+                        is_final=entry.is_final,
+                        speaker=self.store.speaker_name(entry.speaker),
+                    )
+                    kept.append((entry.tr_id, sp))
+
+            self.store = TranscriptStore()
+            for tr_id, sp in kept:
+                self.store.put(tr_id, sp["speaker"], sp["is_final"], sp["message"])
+            self.stamps = {
+                tr_id: self.stamps[tr_id] for tr_id, _ in kept if tr_id in self.stamps
+            }
 
-        return c(c(inp, f"{word} "), f" {word}")
+            self.summ = summary
+            self.prompt = ""
+            self.last_speaker = None
+            self.built = 0
+            self.stale = False
+            return kept
 
 
 # ---- SummaryRepo
@@ -116,6 +217,9 @@ class SummaryRepo:
         )
         self.get_active_summaries_endp = "http://localhost:8899/api/summary/active"
 
+        # viewers of one meeting poll its summary at the same time
+        self.flight = SingleFlight()
+
     def init_summary(self, bot_id, platform: str, detalization: str) -> bool:
         try:
             req = {
@@ -128,7 +232,7 @@ class SummaryRepo:
             logger.info("seq for init summary: %s", req)
 
             wrap_http_err(
-                requests.post(
+                http_client().post(
                     self.save_endp,
                     json=req,
                 )
@@ -151,7 +255,7 @@ class SummaryRepo:
             logger.info("seq for save: %s", req)
 
             wrap_http_err(
-                requests.post(
+                http_client().post(
                     self.save_endp,
                     json=req,
                 )
@@ -165,7 +269,7 @@ class SummaryRepo:
     def update_role_text(self, bot_id, summary_with_role, role) -> bool:
         try:
             wrap_http_err(
-                requests.post(
+                http_client().post(
                     self.update_role_text_endp,
                     json={
                         "text_with_role": summary_with_role,
@@ -182,7 +286,7 @@ class SummaryRepo:
 
     def get_active_summaries(self) -> Optional[list[SummaryModel]]:
         try:
-            resp = wrap_http_err(requests.get(self.get_active_summaries_endp))
+            resp = wrap_http_err(http_client().get(self.get_active_summaries_endp))
             resp_json: list[SummaryModel] = resp.json()
             logger.info("active summary_models from repo: %s", resp.json())
             return resp_json
@@ -192,8 +296,11 @@ class SummaryRepo:
         return None
 
     def get_summary(self, bot_id) -> Optional[SummaryModel]:
+        return self.flight.do(("get_summary", bot_id), lambda: self._get_summary(bot_id))
+
+    def _get_summary(self, bot_id) -> Optional[SummaryModel]:
         try:
-            resp = wrap_http_err(requests.get(f"{self.get_endp}/{bot_id}"))
+            resp = wrap_http_err(http_client().get(f"{self.get_endp}/{bot_id}"))
             resp_json: SummaryModel = resp.json()
             logger.info("summary_model from repo: %s", resp.json())
             return resp_json
@@ -204,7 +311,7 @@ class SummaryRepo:
 
     def get_summ(self, bot_id) -> Optional[tuple[str, bool]]:
         try:
-            resp = requests.get(f"{self.get_endp}/{bot_id}")
+            resp = http_client().get(f"{self.get_endp}/{bot_id}")
             resp_json: SummaryModel = resp.json()
             text = resp_json["text"]
             active = resp_json["active"]
@@ -216,7 +323,7 @@ class SummaryRepo:
 
     def get_summ_with_role(self, bot_id) -> Optional[tuple[str, str, bool]]:
         try:
-            resp = requests.get(f"{self.get_endp}/{bot_id}")
+            resp = http_client().get(f"{self.get_endp}/{bot_id}")
             resp_json: SummaryModel = resp.json()
             return (resp_json["text_with_role"], resp_json["role"], resp_json["active"])
         except Exception as e:
@@ -226,7 +333,7 @@ class SummaryRepo:
 
     def finish(self, bot_id) -> bool:
         try:
-            resp = requests.get(f"{self.finish_endp}/{bot_id}")
+            resp = http_client().get(f"{self.finish_endp}/{bot_id}")
         except Exception as e:
             logger.error("failed to finish summary:", e)
             return False
@@ -249,27 +356,62 @@ class Bot:
         detalization: str,
         recall_api: RecallApi,
         summary_repo: SummaryRepo,
-        speech_kit: YaSpeechToText,
+        speech_kit: SpeechRecognizer,
+        streaming_stt: Optional[YaStreamingSpeechToText] = None,
+        stt_dispatcher: Optional[SttDispatcher] = None,
+        flush_timer: Optional[FlushTimer] = None,
+        stt_queue_size=SEGMENT_QUEUE_SIZE,
+        stt_overflow_policy=OverflowPolicy.COALESCE,
+        audio_archive_dir: Optional[str] = None,
+        encoding_profile: Optional[EncodingProfile] = None,
+        transcript_log_dir: Optional[str] = None,
         leave_callback: Callable = lambda _: _,
     ):
-        from .real_time_audio import RealTimeAudio
+        from .real_time_audio import RealTimeAudio, TranscriptCounter
+        from .participant_audio import ParticipantStreams
 
         self.bot_id = bot_id
         self.speech_kit = speech_kit
         self.recall_api = recall_api
         self.transcription = FullTranscription()
         self.summary_repo = summary_repo
+        self.transcript_log_dir = transcript_log_dir
+        self.transcript_log = (
+            TranscriptLog(bot_id, transcript_log_dir) if transcript_log_dir else None
+        )
+        # orders log appends with the log rewrite of a summary drop
+        self.log_mutex = Lock()
 
         logger.info(
             f"start RealTimeAudio with bot_id {self.bot_id}, speach_kit {self.speech_kit}"
         )
-        self._real_time_audio = RealTimeAudio(self.bot_id, self.speech_kit)
+        self.tr_counter = TranscriptCounter()
+        self._audio_kwargs = dict(
+            streaming_stt=streaming_stt,
+            on_transcription=self.add_transcription,
+            dispatcher=stt_dispatcher,
+            flush_timer=flush_timer,
+            queue_size=stt_queue_size,
+            overflow_policy=stt_overflow_policy,
+            archive_dir=audio_archive_dir,
+            encoding_profile=encoding_profile,
+            tr_counter=self.tr_counter,
+        )
+        self._real_time_audio = RealTimeAudio(
+            self.bot_id, self.speech_kit, **self._audio_kwargs
+        )
+        self.participants = ParticipantStreams(self._participant_audio)
 
         self.platform = platform
         self.detalization = detalization
 
         self.leave_callback = leave_callback
 
+        # transcription version the last summary cycle finished with
+        self.summarized_version: Optional[int] = None
+        self.summary_cycles = 0
+        self.summary_skips = 0
+
     @staticmethod
     def from_join_meeting(
         bot_name,
@@ -278,7 +420,15 @@ class Bot:
         meeting_url,
         summary_repo: SummaryRepo,
         webhooks: BotWebHooks,
-        speech_kit: YaSpeechToText,
+        speech_kit: SpeechRecognizer,
+        streaming_stt: Optional[YaStreamingSpeechToText] = None,
+        stt_dispatcher: Optional[SttDispatcher] = None,
+        flush_timer: Optional[FlushTimer] = None,
+        stt_queue_size=SEGMENT_QUEUE_SIZE,
+        stt_overflow_policy=OverflowPolicy.COALESCE,
+        audio_archive_dir: Optional[str] = None,
+        encoding_profile: Optional[EncodingProfile] = None,
+        transcript_log_dir: Optional[str] = None,
         leave_callback: Callable = lambda _: _,
     ):
         recall_api = RecallApi(recall_api_token=recall_api_token)
@@ -302,12 +452,43 @@ class Bot:
             recall_api=recall_api,
             leave_callback=leave_callback,
             speech_kit=speech_kit,
+            streaming_stt=streaming_stt,
+            stt_dispatcher=stt_dispatcher,
+            flush_timer=flush_timer,
+            stt_queue_size=stt_queue_size,
+            stt_overflow_policy=stt_overflow_policy,
+            audio_archive_dir=audio_archive_dir,
+            encoding_profile=encoding_profile,
+            transcript_log_dir=transcript_log_dir,
+        )
+
+    def _participant_audio(self, participant_id, streaming: bool) -> "RealTimeAudio":
+        from .real_time_audio import RealTimeAudio  # maybe cyclic
+
+        kwargs = dict(self._audio_kwargs)
+        if not streaming:
+            kwargs["streaming_stt"] = None
+        return RealTimeAudio(
+            self.bot_id, self.speech_kit, participant_id=participant_id, **kwargs
         )
 
     @property
     def real_time_audio(self) -> Optional["RealTimeAudio"]:
         return self._real_time_audio
 
+    # the combined stream and every separate participant stream
+    def audio_streams(self) -> list["RealTimeAudio"]:
+        return [self._real_time_audio, *self.participants.all()]
+
+    # VAD, governor and overlap counters of every audio stream, keyed by
+    # "combined" or the participant id
+    def audio_stats(self) -> dict:
+        stats = {}
+        for rt_audio in self.audio_streams():
+            key = rt_audio.participant_id
+            stats["combined" if key is None else str(key)] = rt_audio.stats()
+        return stats
+
     def leave(self):
         resp = self.recall_api.stop_recording(self.bot_id).json()
         logger.debug(resp)
@@ -321,9 +502,52 @@ class Bot:
         resp = self.recall_api.transcript(self.bot_id, diarization).json()
         return json.dumps(resp)
 
+    # a dialogue over the budget of summary_transf is summarized piece by
+    # piece, every piece continues the summary of the previous ones
+    @staticmethod
+    def _summarize(
+        summary_transf: Callable, prompt: str, summ: str, dialogue: str
+    ) -> Optional[str]:
+        budget = getattr(summary_transf, "input_budget", None)
+        if budget is None or estimate_tokens(prompt) <= budget:
+            return summary_transf(prompt)
+
+        # half of the budget is left for the summary so far
+        pieces = split_to_budget(dialogue, budget // 2)
+        logger.info(f"make_summary: dialogue split into {len(pieces)} pieces")
+        for piece in pieces:
+            summ = summary_transf(FullTranscription.with_summary(summ, piece))
+            if summ is None or summ == "":
+                return None
+        return summ
+
     # add_transcription(Transcription.from_recall_resp(response['transcipt']))
     def add_transcription(self, tr: Transcription):
-        self.transcription.add(tr["id"], tr["sp"])
+        with self.log_mutex:
+            if not self.transcription.add(tr["id"], tr["sp"]):
+                return
+            if self.transcript_log is not None:
+                self.transcript_log.append(tr["id"], tr["sp"])
+
+    # the summary from the repo, then what the transcript log has since the
+    # last summary drop; the log's summary wins when the repo save was lost
+    def restore_transcription(self, summary: str):
+        self.transcription.drop_to_summ(summary=summary)
+        if self.transcript_log is None:
+            return
+
+        start = time.monotonic()
+        replay = TranscriptLog.replay(self.bot_id, self.transcript_log_dir)
+        if replay.summ is not None:
+            self.transcription.drop_to_summ(summary=replay.summ)
+        for tr_id, sp in replay.t.items():
+            self.transcription.add(tr_id, sp, count=False)
+        self.tr_counter.advance(replay.next_tr_id)
+
+        logger.info(
+            f"replayed {replay.records} records of {self.bot_id} "
+            f"in {time.monotonic() - start:.3f}s"
+        )
 
     def make_summary(
         self,
@@ -331,18 +555,28 @@ class Bot:
         min_prompt_len,
         summary_cleaner: Optional[Callable],
     ) -> None:
-        prompt = self.transcription.to_prompt()
-        logger.info(f"Промпт: {prompt}")
-        if prompt is None:
+        self.summary_cycles += 1
+        if self.transcription.version == self.summarized_version:
+            self.summary_skips += 1
+            logger.info(f"make_summary: {self.bot_id} unchanged, skipped")
+            return
+
+        # finals that arrive while the summary is made stay for the next one
+        version, prev_summ, dialogue = self.transcription.snapshot()
+        if dialogue is None:
+            self.summarized_version = version
             return
+        prompt = FullTranscription.with_summary(prev_summ, dialogue)
+        logger.info(f"Промпт: {prompt}")
 
         # logger.info("sync transcrpt: %s", self.transcript_full(False))
 
         if len(prompt) < min_prompt_len:
             logger.info(f"prompt less than {min_prompt_len}")
+            self.summarized_version = version
             return
 
-        summ = summary_transf(self.transcription.to_prompt())
+        summ = Bot._summarize(summary_transf, prompt, prev_summ, dialogue)
         logger.info("make_summary: %s", summ)
 
         if summ is None or summ == "":
@@ -353,7 +587,11 @@ class Bot:
             logger.info("cleaned_sum: %s", summ)
 
         if summ is not None and summ != "":
-            self.transcription.drop_to_summ(summ)
+            self.summarized_version = version
+            with self.log_mutex:
+                kept = self.transcription.drop_to_summ(summ, version)
+                if self.transcript_log is not None:
+                    self.transcript_log.drop_to_summ(summ, self.tr_counter.value, kept)
 
             self.summary_repo.save(
                 summary=summ,
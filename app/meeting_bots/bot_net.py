@@ -1,24 +1,28 @@
 from collections import defaultdict
-from threading import Lock
+from threading import Lock, Thread
 from typing import Dict, Optional, TypedDict, Callable
 
 import schedule
-from ..gpt_utils import gpt_req_sender
+from ..audio import LPCM_FORMAT, encoding_profile, encoding_stats
+from ..gpt_cache import gpt_cache
+from ..gpt_utils import gpt_flight, gpt_req_sender
+from ..http_client import http_client
 from ..logger import Logger
 from .bot import (
     Bot,
     BotWebHooks,
     SummaryRepo,
 )  # TODO: SummaryRepo maybe cyclic
-from ..speach_kit import YaSpeechToText
+from ..speach_kit import SpeechRecognizer, YaSpeechToText, YaStreamingSpeechToText
 from .recall_ws_hooks import RecallWsHooks  # TODO: maybe cyclic
+from .compaction import compaction_stats
+from .flush_timer import FlushTimer
+from .stt_dispatcher import SttDispatcher
+from .transcript_ingest import TranscriptIngest
 
 
 logger = Logger().get_logger(__name__)
 
-TRANSCRIPT_TIMESTAMP_STEP = 5
-THRESHOLD_TIMESTAMP_STEP = 25
-
 
 class BotConfig(TypedDict):
     RECALL_API_TOKEN: str
@@ -37,6 +41,20 @@ class BotConfig(TypedDict):
     SUMM_TRANSFER_PROMPT: str | Callable  # callable is for prompts with detaliziation
     SUMM_CLEANER_PROMPT: str
     SUMM_INTERVAL_SEC: int
+    YA_SPEECH_KIT_STREAMING: bool
+    YA_SPEECH_KIT_GRPC_ENDPOINT: str
+    YA_SPEECH_KIT_GRPC_SECURE: bool
+    STT_WORKERS: int
+    STT_QUEUE_SIZE: int
+    STT_OVERFLOW_POLICY: str
+    STT_RATE_LIMIT: float
+    STT_RATE_BURST: float
+    AUDIO_ARCHIVE_DIR: Optional[str]
+    STT_AUDIO_PROFILE: str
+    STT_BACKEND: str
+    STT_MODEL_PATH: Optional[str]
+    STT_LOCAL_WORKERS: int
+    TRANSCRIPT_LOG_DIR: Optional[str]
 
 
 # bot can be accessed by user id (string)
@@ -47,6 +65,10 @@ class BotNet:
 
         # self.jobs_by_bot: Dict[str, List[schedule.Job]] = {}
         self.jobs_by_bot = defaultdict(list)
+        # bot_id: the summary job of the bot, run once more on leave
+        self.summary_by_bot: Dict[str, Callable] = {}
+        # bots that left and still recognize their last segments
+        self.leaving: Dict[str, Bot] = {}
 
         logger.info("Botnet config %s", config)
 
@@ -54,6 +76,10 @@ class BotNet:
 
         self.config = config
 
+        from .recall_api import RecallApi
+
+        self._recall_api = RecallApi(recall_api_token=config["RECALL_API_TOKEN"])
+
         self._ws_hooks = RecallWsHooks(self)
 
         self.summary_baker = SummaryBaker(
@@ -66,9 +92,34 @@ class BotNet:
             finish_endp=self.config["SUMM_FINISHER_ENDP"],
         )
 
-        self.speech_kit = YaSpeechToText(
-            api_key=config["YA_SPEECH_KIT_API_KEY"],
-            ffmpeg_path=config["FFMPEG_PATH"],
+        self.speech_kit = BotNet._make_recognizer(config)
+
+        self.encoding_profile = encoding_profile(config["STT_AUDIO_PROFILE"])
+        if self.speech_kit.pcm_only and self.encoding_profile.audio_format != LPCM_FORMAT:
+            logger.warning(
+                f"{config['STT_BACKEND']} takes raw PCM, "
+                f"ignoring STT_AUDIO_PROFILE {self.encoding_profile.name}"
+            )
+            self.encoding_profile = encoding_profile("lpcm")
+
+        # the SpeechKit rate limit does not apply to an offline backend
+        self.stt_dispatcher = SttDispatcher(
+            workers=config["STT_WORKERS"],
+            rate=None if config["STT_BACKEND"] == "vosk" else config["STT_RATE_LIMIT"],
+            burst=config["STT_RATE_BURST"],
+        )
+
+        self.flush_timer = FlushTimer()
+        self.transcript_ingest = TranscriptIngest(self)
+
+        self.streaming_stt = (
+            YaStreamingSpeechToText(
+                api_key=config["YA_SPEECH_KIT_API_KEY"],
+                endpoint=config["YA_SPEECH_KIT_GRPC_ENDPOINT"],
+                secure=config["YA_SPEECH_KIT_GRPC_SECURE"],
+            )
+            if config["YA_SPEECH_KIT_STREAMING"]
+            else None
         )
 
         if clean_non_active:
@@ -76,6 +127,23 @@ class BotNet:
                 summary_repo=self.summary_repo, recall_api=self.recall_api
             ).clean()
 
+    @staticmethod
+    def _make_recognizer(config: BotConfig) -> SpeechRecognizer:
+        if config["STT_BACKEND"] == "vosk":
+            from ..local_stt import VoskSpeechToText
+
+            if not config["STT_MODEL_PATH"]:
+                raise Exception("STT_MODEL_PATH not set")
+            return VoskSpeechToText(
+                model_path=config["STT_MODEL_PATH"],
+                workers=config["STT_LOCAL_WORKERS"],
+            )
+
+        return YaSpeechToText(
+            api_key=config["YA_SPEECH_KIT_API_KEY"],
+            ffmpeg_path=config["FFMPEG_PATH"],
+        )
+
     @property
     def ws_hooks(self) -> RecallWsHooks:
         return self._ws_hooks
@@ -133,16 +201,52 @@ class BotNet:
     ):
         def leave_callback(bot: Bot):
             logger.info("leaving")
-            bot.summary_repo.finish(bot_id=bot.bot_id)
 
             # TODO: remove _stop_jobs.from mutex
             with self.mutex:
-                self.botnet.pop(bot.bot_id, None)
+                # the scheduler and stop_recording may both see the bot leave
+                if self.botnet.get(bot.bot_id) is not bot:
+                    return
+                self.botnet.pop(bot.bot_id)
+                self.leaving[bot.bot_id] = bot
                 BotNet._stop_jobs(self.jobs_by_bot.get(bot.bot_id, None))
                 self.jobs_by_bot.pop(bot.bot_id, None)
+                final_summary = self.summary_by_bot.pop(bot.bot_id, None)
+
+            # recognizing the last segments takes a while, the scheduler
+            # thread and the stop_recording request do not wait for it
+            Thread(
+                target=self._finish_bot,
+                args=(bot, final_summary),
+                name=f"leave-{bot.bot_id}",
+                daemon=True,
+            ).start()
 
         return leave_callback
 
+    # the buffered audio is recognized and summarized once more before the
+    # summary is finished and the transcript log removed
+    def _finish_bot(self, bot: Bot, final_summary: Optional[Callable]):
+        try:
+            streams = bot.audio_streams()
+            for rt_audio in streams:
+                rt_audio.flush(idle=True)
+            for rt_audio in streams:
+                rt_audio.close()
+
+            if final_summary is not None:
+                try:
+                    final_summary()
+                except Exception as e:
+                    logger.error(f"final summary of {bot.bot_id} failed: {e}")
+
+            bot.summary_repo.finish(bot_id=bot.bot_id)
+            if bot.transcript_log is not None:
+                bot.transcript_log.close(remove=True)
+        finally:
+            with self.mutex:
+                self.leaving.pop(bot.bot_id, None)
+
     def _schedule_jobs_for_bot(
         self,
         bot: Bot,
@@ -157,23 +261,6 @@ class BotNet:
                 summary_transf, self.config["MIN_PROMPT_LEN"], summary_cleaner
             )
 
-        def transcript_scheduler():
-            logger.info("transcript_scheduler called")
-
-            rt_audio = bot.real_time_audio
-            if rt_audio is None:
-                logger.error("bot.real_time_audio is None")
-            else:
-                if rt_audio.events_queue:
-                    rt_audio.timestamp_counter += TRANSCRIPT_TIMESTAMP_STEP
-                with rt_audio.mutex:
-                    if rt_audio.timestamp_counter >= THRESHOLD_TIMESTAMP_STEP:
-                        tr = rt_audio.get_transcription()
-                        if tr:
-                            bot.add_transcription(tr)
-                    else:
-                        logger.info(f"Spent {rt_audio.timestamp_counter}")
-
         def check_stop_schedurer():
             logger.info("check_stop_schedurer called")
             state = bot.recording_state()
@@ -184,13 +271,10 @@ class BotNet:
 
         job1 = schedule.every(summary_interval_sec).seconds.do(summary_scheduler)
 
-        job2 = schedule.every(TRANSCRIPT_TIMESTAMP_STEP).seconds.do(
-            transcript_scheduler
-        )
+        job2 = schedule.every(30).seconds.do(check_stop_schedurer)
 
-        job3 = schedule.every(30).seconds.do(check_stop_schedurer)
-
-        self.jobs_by_bot[bot.bot_id].extend([job1, job2, job3])
+        self.jobs_by_bot[bot.bot_id].extend([job1, job2])
+        self.summary_by_bot[bot.bot_id] = summary_scheduler
 
     @staticmethod
     def _stop_jobs(jobs):
@@ -221,6 +305,14 @@ class BotNet:
             summary_repo=self.summary_repo,
             webhooks=self.config["WEBHOOKS"],
             speech_kit=self.speech_kit,
+            streaming_stt=self.streaming_stt,
+            stt_dispatcher=self.stt_dispatcher,
+            flush_timer=self.flush_timer,
+            stt_queue_size=self.config["STT_QUEUE_SIZE"],
+            stt_overflow_policy=self.config["STT_OVERFLOW_POLICY"],
+            audio_archive_dir=self.config["AUDIO_ARCHIVE_DIR"],
+            encoding_profile=self.encoding_profile,
+            transcript_log_dir=self.config["TRANSCRIPT_LOG_DIR"],
             leave_callback=self._get_leave_callback(),
         )
 
@@ -240,6 +332,11 @@ class BotNet:
         self,
         bot_id,
     ) -> Optional[Bot]:
+        # still active in the repo until its last segments are summarized
+        with self.mutex:
+            if bot_id in self.leaving:
+                return None
+
         summary_model = self.summary_repo.get_summary(bot_id)
         if summary_model is None or not summary_model["active"]:
             return None
@@ -248,19 +345,26 @@ class BotNet:
         detalization = summary_model["detalization"]
         platform = summary_model["platform"]
 
-        from .recall_api import RecallApi
         from .platform_parser import Platform
 
         bot = Bot(
             bot_id=bot_id,
             detalization=detalization,
             platform=Platform.from_str(platform),
-            recall_api=RecallApi(self.config["RECALL_API_TOKEN"]),
+            recall_api=self.recall_api,
             summary_repo=self.summary_repo,
             speech_kit=self.speech_kit,
+            streaming_stt=self.streaming_stt,
+            stt_dispatcher=self.stt_dispatcher,
+            flush_timer=self.flush_timer,
+            stt_queue_size=self.config["STT_QUEUE_SIZE"],
+            stt_overflow_policy=self.config["STT_OVERFLOW_POLICY"],
+            audio_archive_dir=self.config["AUDIO_ARCHIVE_DIR"],
+            encoding_profile=self.encoding_profile,
+            transcript_log_dir=self.config["TRANSCRIPT_LOG_DIR"],
             leave_callback=self._get_leave_callback(),
         )
-        bot.transcription.drop_to_summ(summary=summ)
+        bot.restore_transcription(summary=summ)
         self._setup_bot(
             bot=bot,
         )
@@ -284,11 +388,42 @@ class BotNet:
 
         return bot
 
+    # stops the shared workers and the recognizer on shutdown
+    def close(self):
+        self.transcript_ingest.stop()
+        self.flush_timer.stop()
+        self.stt_dispatcher.stop()
+        self.speech_kit.close()
+
+    def stats(self) -> dict:
+        with self.mutex:
+            bots = list(self.botnet.values())
+            leaving = len(self.leaving)
+
+        return {
+            "bots": len(bots),
+            "leaving": leaving,
+            "summary": {
+                "cycles": sum(bot.summary_cycles for bot in bots),
+                "skipped": sum(bot.summary_skips for bot in bots),
+            },
+            "audio": {bot.bot_id: bot.audio_stats() for bot in bots},
+            "stt": self.stt_dispatcher.stats(),
+            "flush_timer": self.flush_timer.stats(),
+            "transcript_ingest": self.transcript_ingest.stats(),
+            "encoding": encoding_stats(),
+            "compaction": compaction_stats(),
+            "http": http_client().stats(),
+            "gpt_cache": gpt_cache().stats(),
+            "single_flight": {
+                "gpt": gpt_flight.stats(),
+                "get_summary": self.summary_repo.flight.stats(),
+            },
+        }
+
     @property
     def recall_api(self):
-        from .recall_api import RecallApi
-
-        return RecallApi(recall_api_token=self.config["RECALL_API_TOKEN"])
+        return self._recall_api
 
 
 class SummaryBaker:
@@ -0,0 +1,80 @@
+import re
+from threading import Lock
+
+from ..tokens import estimate_tokens
+
+# one pass over a message: hesitation fillers and the recognizer's "noise"
+# tokens are dropped, a phrase of 2 to 6 words repeated back to back (a
+# partial result re-sent inside the final one) is kept once, and runs of
+# whitespace are collapsed. A single repeated word ("да да") and numbers
+# ("100 100 рублей") may be meant and are kept.
+COMPACT_RE = re.compile(
+    r"(?P<filler>\b(?:э{2,}|э+м+|м{2,}|хм+|uh+|um+|erm|noise)\b[,.]?\s*)"
+    r"|(?P<repeat>\b([^\W\d_]+(?:\s+[^\W\d_]+){1,5})(?:[\s,.]+\3\b)+)"
+    r"|(?P<space>\s{2,})",
+    flags=re.IGNORECASE,
+)
+
+
+def _replace(match: re.Match) -> str:
+    if match.group("filler") is not None:
+        return ""
+    if match.group("repeat") is not None:
+        return match.group(3)
+    return " "
+
+
+class CompactionStats:
+    def __init__(self):
+        self.mutex = Lock()
+        self.messages = 0
+        self.merged_turns = 0
+        self.chars_in = 0
+        self.chars_out = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+
+    def add_message(self, raw: str, compacted: str):
+        with self.mutex:
+            self.messages += 1
+            self.chars_in += len(raw)
+            self.chars_out += len(compacted)
+            self.tokens_in += estimate_tokens(raw)
+            self.tokens_out += estimate_tokens(compacted)
+
+    # a turn appended to the previous one of the same speaker saves the
+    # "speaker: " prefix and the line break
+    def add_merge(self, speaker: str):
+        with self.mutex:
+            self.merged_turns += 1
+            self.chars_in += len(speaker) + 2
+            self.tokens_in += estimate_tokens(speaker) + 1
+
+    def as_dict(self) -> dict:
+        with self.mutex:
+            return {
+                "messages": self.messages,
+                "merged_turns": self.merged_turns,
+                "chars_saved": self.chars_in - self.chars_out,
+                "tokens_saved": self.tokens_in - self.tokens_out,
+            }
+
+
+_compaction_stats = CompactionStats()
+
+
+def compaction_stats() -> dict:
+    return _compaction_stats.as_dict()
+
+
+def compact(message: str) -> str:
+    return COMPACT_RE.sub(_replace, message).strip(" ,")
+
+
+# counted once per turn, when it becomes final
+def count_message(raw: str, compacted: str):
+    _compaction_stats.add_message(raw, compacted)
+
+
+def count_merge(speaker: str):
+    _compaction_stats.add_merge(speaker)
@@ -0,0 +1,88 @@
+import heapq
+import itertools
+import time
+from threading import Condition, Thread
+from typing import Callable, Hashable, Optional
+
+from ..logger import Logger
+
+logger = Logger().get_logger(__name__)
+
+
+# One thread with a deadline heap shared by all audio streams. A stream arms
+# its key once, the callback returns the next deadline to stay armed or None
+# to disarm, so streams that get no audio cost nothing.
+class FlushTimer(Thread):
+    def __init__(self):
+        super().__init__(name="flush-timer", daemon=True)
+        self.cond = Condition()
+        self.heap: list[tuple[float, int, Hashable]] = []
+        self.seq = itertools.count()
+        # key -> (deadline, callback) of the armed keys
+        self.armed: dict[Hashable, tuple[float, Callable[[], Optional[float]]]] = {}
+        self.stopped = False
+        self.fired = 0
+        self.start()
+
+    def schedule(
+        self, key: Hashable, at: float, callback: Callable[[], Optional[float]]
+    ):
+        with self.cond:
+            if key in self.armed:
+                return
+            self._push(key, at, callback)
+
+    def cancel(self, key: Hashable):
+        with self.cond:
+            self.armed.pop(key, None)
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+
+    def _push(self, key, at, callback):
+        self.armed[key] = (at, callback)
+        heapq.heappush(self.heap, (at, next(self.seq), key))
+        if self.heap[0][2] == key:
+            self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                callback = None
+                while callback is None:
+                    if self.stopped:
+                        return
+                    if not self.heap:
+                        self.cond.wait()
+                        continue
+
+                    at, _, key = self.heap[0]
+                    armed = self.armed.get(key)
+                    # cancelled or re-armed later, the entry is stale
+                    if armed is None or armed[0] != at:
+                        heapq.heappop(self.heap)
+                        continue
+
+                    delay = at - time.monotonic()
+                    if delay > 0:
+                        self.cond.wait(delay)
+                        continue
+
+                    heapq.heappop(self.heap)
+                    callback = self.armed.pop(key)[1]
+
+            self.fired += 1
+            try:
+                next_at = callback()
+            except Exception as e:
+                logger.error(f"FlushTimer: callback of {key} failed: {e}")
+                continue
+
+            if next_at is not None:
+                self.schedule(key, next_at, callback)
+
+    def stats(self) -> dict:
+        with self.cond:
+            return {"armed": len(self.armed), "fired": self.fired}
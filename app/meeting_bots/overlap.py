@@ -0,0 +1,84 @@
+import re
+
+from ..audio import PCM_BYTES_PER_SEC, PCM_SAMPLE_WIDTH
+from ..logger import Logger
+
+logger = Logger().get_logger(__name__)
+
+OVERLAP_INITIAL_SEC = 0.6
+OVERLAP_MIN_SEC = 0.2
+OVERLAP_MAX_SEC = 1.5
+OVERLAP_MAX_WORDS = 8
+OVERLAP_GROW = 1.25
+OVERLAP_SHRINK = 0.9
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _norm(word: str) -> str:
+    match = _WORD_RE.search(word.lower().replace("ё", "е"))
+    return match.group(0) if match else ""
+
+
+# When a long turn of one speaker is flushed mid-speech, the tail of the cut
+# is sent again at the head of the next segment, so a word split by the cut
+# is recognized whole. The reconciler removes the words recognized twice and
+# tunes the overlap length: no match means the overlap was too short to hold
+# a word, more than one matched word means it can be shorter. An overlap cut
+# in silence holds no word at any length and does not tune it.
+class OverlapReconciler:
+    def __init__(
+        self,
+        initial_sec=OVERLAP_INITIAL_SEC,
+        min_sec=OVERLAP_MIN_SEC,
+        max_sec=OVERLAP_MAX_SEC,
+        max_words=OVERLAP_MAX_WORDS,
+    ):
+        self.overlap_sec = initial_sec
+        self.min_sec = min_sec
+        self.max_sec = max_sec
+        self.max_words = max_words
+
+        self.merges = 0
+        self.removed_words = 0
+
+    @property
+    def overlap_bytes(self) -> int:
+        samples = int(self.overlap_sec * PCM_BYTES_PER_SEC) // PCM_SAMPLE_WIDTH
+        return samples * PCM_SAMPLE_WIDTH
+
+    @staticmethod
+    def matched_words(prev_text: str, text: str, max_words: int) -> int:
+        prev = [_norm(w) for w in prev_text.split()[-max_words:]]
+        head = [_norm(w) for w in text.split()[:max_words]]
+        for k in range(min(len(prev), len(head)), 0, -1):
+            if prev[-k:] == head[:k]:
+                return k
+        return 0
+
+    # returns `text` without the words already present at the end of prev_text
+    def merge(self, prev_text: str, text: str, voiced=True) -> str:
+        k = self.matched_words(prev_text, text, self.max_words)
+        if voiced:
+            self._adapt(k)
+
+        self.merges += 1
+        self.removed_words += k
+        if k == 0:
+            return text
+
+        logger.info(f"OverlapReconciler: removed {k} duplicated words")
+        return " ".join(text.split()[k:])
+
+    def _adapt(self, matched):
+        if matched == 0:
+            self.overlap_sec = min(self.max_sec, self.overlap_sec * OVERLAP_GROW)
+        elif matched > 1:
+            self.overlap_sec = max(self.min_sec, self.overlap_sec * OVERLAP_SHRINK)
+
+    def stats(self) -> dict:
+        return {
+            "overlap_sec": round(self.overlap_sec, 3),
+            "merges": self.merges,
+            "removed_words": self.removed_words,
+        }
@@ -0,0 +1,79 @@
+from threading import Lock
+from typing import Callable, Optional
+
+from ..logger import Logger
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .real_time_audio import RealTimeAudio
+
+logger = Logger().get_logger(__name__)
+
+PARTICIPANT_ID_BYTES = 4
+# every streaming participant holds its own gRPC session, the rest of the
+# participants of a bot are recognized segment by segment
+STREAMING_SESSIONS_PER_BOT = 4
+
+
+def participant_frame(message: bytes) -> tuple[int, memoryview]:
+    # separate streams frame: 4-byte little-endian participant id, then PCM
+    participant_id = int.from_bytes(message[0:PARTICIPANT_ID_BYTES], byteorder="little")
+    return participant_id, memoryview(message)[PARTICIPANT_ID_BYTES:]
+
+
+# Per-participant audio of a bot in separate streams mode. Every participant
+# gets its own RealTimeAudio, named after them as soon as the speaker
+# timeline tells who the participant id belongs to. The factory is told
+# whether the stream may open a streaming recognition session.
+class ParticipantStreams:
+    def __init__(
+        self,
+        factory: Callable[[int, bool], "RealTimeAudio"],
+        max_streaming=STREAMING_SESSIONS_PER_BOT,
+    ):
+        self.factory = factory
+        self.max_streaming = max_streaming
+        self.streaming = 0
+        self.streams: dict[int, "RealTimeAudio"] = {}
+        self.names: dict[int, str] = {}
+        self.mutex = Lock()
+
+    def name(self, participant_id) -> str:
+        return self.names.get(participant_id, f"Speaker {participant_id}")
+
+    def set_name(self, participant_id, name):
+        with self.mutex:
+            if self.names.get(participant_id) == name:
+                return
+            self.names[participant_id] = name
+            stream = self.streams.get(participant_id)
+
+        if stream is not None:
+            stream.set_speaker(name)
+
+    def get(self, participant_id) -> "RealTimeAudio":
+        with self.mutex:
+            stream = self.streams.get(participant_id)
+            if stream is not None:
+                return stream
+
+            logger.info(f"new participant stream {participant_id}")
+            stream = self.factory(participant_id, self.streaming < self.max_streaming)
+            if stream.streaming:
+                self.streaming += 1
+            stream.set_speaker(self.name(participant_id))
+            self.streams[participant_id] = stream
+            return stream
+
+    def save_frame(self, message: bytes):
+        participant_id, pcm = participant_frame(message)
+        self.get(participant_id).save_segment(pcm)
+
+    def all(self) -> list["RealTimeAudio"]:
+        with self.mutex:
+            return list(self.streams.values())
+
+    def find(self, participant_id) -> Optional["RealTimeAudio"]:
+        with self.mutex:
+            return self.streams.get(participant_id)
@@ -1,7 +1,41 @@
+import os
+import time
 from threading import Lock
 from collections import deque
-from ..audio import AudioRaw, AudioConverter
-from ..speach_kit import YaSpeechToText
+from typing import Callable, Optional
+
+import numpy as np
+
+from ..audio import (
+    AudioArchive,
+    AudioConverter,
+    EncodedAudio,
+    EncodingProfile,
+    OpusStreamEncoder,
+    OGG_OPUS_FORMAT,
+    encoding_profile as encoding_profile_by_name,
+    PcmRingBuffer,
+    StreamIndex,
+    PCM_BYTES_PER_SEC,
+    PCM_SAMPLE_WIDTH,
+)
+from ..speach_kit import (
+    StreamingRecognitionSession,
+    StreamingResult,
+    SpeechRecognizer,
+    YaStreamingSpeechToText,
+)
+from ..vad import VAD_MAX_THRESHOLD_DB, VadStats, VoiceActivityDetector
+from .flush_timer import FlushTimer
+from .overlap import OverlapReconciler
+from .segment_governor import SegmentGovernor
+from .stt_dispatcher import SttDispatcher
+from .segment_queue import (
+    OverflowPolicy,
+    SegmentQueue,
+    SpeechSegment,
+    SEGMENT_QUEUE_SIZE,
+)
 
 from ..logger import Logger
 
@@ -16,90 +50,454 @@ if TYPE_CHECKING:
 class SpeakerEvent:
     speaker: str
     unmute_ts: float
+    arrival_pos: int
 
-    def __init__(self, speaker, unmute_ts):
+    def __init__(self, speaker, unmute_ts, arrival_pos=0):
         self.speaker = speaker
         self.unmute_ts = unmute_ts
+        self.arrival_pos = arrival_pos
+
+
+# Transcript ids of one bot. Shared by every audio stream of the bot so
+# that ids stay unique and follow the order in which segments were cut.
+class TranscriptCounter:
+    def __init__(self, start=0):
+        self.value = start
+        self.mutex = Lock()
+
+    def next(self) -> int:
+        with self.mutex:
+            value = self.value
+            self.value += 1
+            return value
+
+    # ids below `value` are taken, e.g. by a replayed transcript log
+    def advance(self, value: int):
+        with self.mutex:
+            self.value = max(self.value, value)
+
+
+BUFFER_CAPACITY_SEC = 120
+# audio kept before the first speaker event, the event may arrive late
+PREROLL_SEC = 5
+# a turn is cut once this much of it is buffered
+FLUSH_MAX_SEC = 25
+# or at the first pause once it is this long
+FLUSH_PAUSE_MIN_SEC = 8
+FLUSH_PAUSE_SEC = 0.6
+FLUSH_PAUSE_DB = VAD_MAX_THRESHOLD_DB
+# or when the stream got no audio for this long
+FLUSH_IDLE_SEC = 3
+# close() waits this long for the last segments to be recognized
+CLOSE_DRAIN_SEC = 30
+STREAMING_IDS_KEEP = 64
 
-LAGS = 6400 * 3
 
 class RealTimeAudio:
     from .bot import Transcription
 
-    def __init__(self, bot_id, speech_kit: YaSpeechToText):
+    def __init__(
+        self,
+        bot_id,
+        speech_kit: SpeechRecognizer,
+        streaming_stt: Optional[YaStreamingSpeechToText] = None,
+        on_transcription: Optional[Callable[[Transcription], None]] = None,
+        dispatcher: Optional[SttDispatcher] = None,
+        queue_size=SEGMENT_QUEUE_SIZE,
+        overflow_policy=OverflowPolicy.COALESCE,
+        archive_dir: Optional[str] = None,
+        encoding_profile: Optional[EncodingProfile] = None,
+        tr_counter: Optional[TranscriptCounter] = None,
+        participant_id: Optional[int] = None,
+        flush_timer: Optional[FlushTimer] = None,
+    ):
         # self.audio_file_manager = AudioFileManager(bot_id)
         self.events_queue: deque[SpeakerEvent] = deque()
-        self.tr_counter = 0
-        self.timestamp_counter = 0
+        self.stream_index = StreamIndex()
+        self.tr_counter = tr_counter or TranscriptCounter()
+        self.participant_id = participant_id
         self.speech_kit = speech_kit
-        self.buffer = []
+        self.buffer = PcmRingBuffer(BUFFER_CAPACITY_SEC * PCM_BYTES_PER_SEC)
+        self.profile = encoding_profile or encoding_profile_by_name("opus")
+        self.encoder = (
+            OpusStreamEncoder(
+                bitrate=self.profile.bitrate, input_rate=self.profile.sample_rate
+            )
+            if self.profile.audio_format == OGG_OPUS_FORMAT
+            else None
+        )
+        self.vad = VoiceActivityDetector()
+        self.vad_stats = VadStats()
+        self.overlap = OverlapReconciler()
+        self.governor = SegmentGovernor(self.vad)
+        self.carried = 0
+        self.carried_speaker: Optional[str] = None
+        self.carried_tr_id: Optional[int] = None
+        # tr_id and text of the last recognized segment of this stream
+        self.last_result: tuple[Optional[int], str] = (None, "")
+        archive_name = (
+            bot_id if participant_id is None else os.path.join(bot_id, str(participant_id))
+        )
+        self.archive = (
+            AudioArchive(archive_name, root=archive_dir) if archive_dir else None
+        )
 
         self.mutex = Lock()
 
-    # get sync transcript (Roman typing)
-    def set_speaker_event(self, speaker, unmute_ts) -> Transcription:
-        t = None
+        self.segments = SegmentQueue(maxsize=queue_size, policy=overflow_policy)
+        self.enqueued = 0
+        # fallbacks of a stream created on its own are stopped in close()
+        self.own_dispatcher = dispatcher is None
+        self.dispatcher = dispatcher or SttDispatcher(workers=1)
+        self.lane_key = (bot_id, id(self))
+        self.dispatcher.register(
+            self.lane_key, bot_id, self.segments, self._process_segment
+        )
+
+        self.own_flush_timer = flush_timer is None
+        self.flush_timer = flush_timer or FlushTimer()
+        self.last_audio = 0.0
+        # trailing bytes of the buffered audio that are quiet
+        self.quiet_bytes = 0
+
+        self.on_transcription = on_transcription
+        self.streaming_ids: dict[int, int] = {}
+        self.streaming_session: Optional[StreamingRecognitionSession] = None
+        if streaming_stt is not None:
+            self.streaming_session = streaming_stt.open_session(
+                self._on_streaming_result
+            )
+
+    @property
+    def streaming(self) -> bool:
+        return self.streaming_session is not None
+
+    def set_audio_offset(self, offset: float):
         with self.mutex:
-            self.events_queue.append(SpeakerEvent(speaker=speaker, unmute_ts=unmute_ts))
-            t = self.get_transcription()
+            self.stream_index.mark(offset, self.buffer.tail)
+        if self.archive is not None:
+            self.archive.mark(offset)
 
-        return t
+    # only records the event and queues finished turns, recognition runs
+    # on the dispatcher workers
+    def set_speaker_event(self, speaker, unmute_ts):
+        with self.mutex:
+            event = SpeakerEvent(
+                speaker=speaker,
+                unmute_ts=unmute_ts,
+                arrival_pos=self.buffer.tail,
+            )
+            # the audio before the first speaker belongs to nobody
+            if not self.events_queue:
+                self.buffer.release(self._event_pos(event))
+            self.events_queue.append(event)
+            if self.streaming:
+                self._prune_timeline()
+                return
+            self._cut_ready()
+
+        self.dispatcher.notify(self.lane_key)
+
+    # separate streams carry one participant, the whole stream is theirs
+    def set_speaker(self, speaker):
+        with self.mutex:
+            # a rename, the carried overlap still belongs to the same person
+            if self.events_queue and self.carried_speaker == self.events_queue[0].speaker:
+                self.carried_speaker = speaker
+            self.events_queue = deque(
+                [SpeakerEvent(speaker=speaker, unmute_ts=0.0, arrival_pos=self.buffer.head)]
+            )
 
     def save_segment(self, audio):
-        self.buffer.extend(audio)
+        if self.archive is not None:
+            self.archive.write(audio)
 
-    def get_transcription(self) -> Transcription:
-        #current_audio_data = bytes(self.buffer)
-        #self.buffer = []
+        if self.streaming:
+            self.streaming_session.feed(bytes(audio))
+            self.buffer.skip(len(audio))
+            return
 
-        # XXX: Roman costyl'
-        if len(self.buffer) > LAGS:
-            current_audio_data = bytes(self.buffer[:-LAGS])
-            self.buffer = self.buffer[len(self.buffer)-LAGS:]
-        else:
-            current_audio_data = bytes(self.buffer)
-            self.buffer = []
+        self.buffer.write(audio)
+        self._track_pause(audio)
 
-        if len(self.events_queue) != 1:
-            current_speaker = self.events_queue.popleft()
+        with self.mutex:
+            if not self.events_queue:
+                self.buffer.release(self.buffer.tail - PREROLL_SEC * PCM_BYTES_PER_SEC)
+            enqueued = self.enqueued
+            if len(self.events_queue) > 1:
+                self._cut_ready()
+            buffered = len(self.buffer) - self.carried
+            if self.events_queue and (
+                buffered >= FLUSH_MAX_SEC * PCM_BYTES_PER_SEC
+                or buffered >= FLUSH_PAUSE_MIN_SEC * PCM_BYTES_PER_SEC
+                and self.quiet_bytes >= FLUSH_PAUSE_SEC * PCM_BYTES_PER_SEC
+            ):
+                self._flush_cut()
+            if self.governor.pending:
+                for segment in self.governor.expired():
+                    self._enqueue(segment)
+            enqueued = self.enqueued != enqueued
+        if enqueued:
+            self.dispatcher.notify(self.lane_key)
+
+        self.last_audio = time.monotonic()
+        self.flush_timer.schedule(
+            self.lane_key, self.last_audio + FLUSH_IDLE_SEC, self._on_idle
+        )
+
+    def _track_pause(self, audio):
+        samples = np.frombuffer(audio, dtype="<i2", count=len(audio) // PCM_SAMPLE_WIDTH)
+        if len(samples) == 0:
+            return
+        power = np.mean(np.square(samples, dtype=np.float64)) / (32768.0**2)
+        if 10.0 * np.log10(power + 1e-12) < FLUSH_PAUSE_DB:
+            self.quiet_bytes += len(audio)
         else:
-            current_speaker = self.events_queue[-1]
+            self.quiet_bytes = 0
+
+    # flush timer callback, the next deadline while audio keeps coming
+    def _on_idle(self) -> Optional[float]:
+        deadline = self.last_audio + FLUSH_IDLE_SEC
+        if time.monotonic() < deadline:
+            return deadline
+        self.flush(idle=True)
+        return None
+
+    def speaker_at(self, pos) -> Optional[str]:
+        speaker = None
+        for event in self.events_queue:
+            if speaker is not None and self._event_pos(event) > pos:
+                break
+            speaker = event.speaker
+        return speaker
 
-        logger.info(f"Processed {current_speaker.speaker}")
+    def _prune_timeline(self):
+        floor = self.buffer.tail - BUFFER_CAPACITY_SEC * PCM_BYTES_PER_SEC
+        while len(self.events_queue) > 1 and self._event_pos(self.events_queue[1]) < floor:
+            self.events_queue.popleft()
 
-        transcipt_text = None
-        try:
-            audio_raw = AudioRaw(current_audio_data)
+    def _on_streaming_result(self, result: StreamingResult):
+        with self.mutex:
+            tr_id = self.streaming_ids.get(result.utterance)
+            if tr_id is None:
+                tr_id = self.tr_counter.next()
+                self.streaming_ids[result.utterance] = tr_id
+                if len(self.streaming_ids) > STREAMING_IDS_KEEP:
+                    self.streaming_ids.pop(min(self.streaming_ids))
+
+            speaker = self.speaker_at(result.start_pos)
+
+        if speaker is None or self.on_transcription is None:
+            return
+
+        self.on_transcription(
+            {
+                "id": tr_id,
+                "sp": {
+                    "is_final": result.is_final,
+                    "message": result.text,
+                    "speaker": speaker,
+                },
+            }
+        )
+
+    def _event_pos(self, event: SpeakerEvent) -> int:
+        pos = self.stream_index.pos_at(event.unmute_ts)
+        return event.arrival_pos if pos is None else pos
+
+    # cuts every finished speaker turn whose audio has fully arrived
+    def _cut_ready(self):
+        while len(self.events_queue) > 1:
+            end = self._event_pos(self.events_queue[1])
+            if end > self.buffer.tail:
+                break
 
-            opus_audio = AudioConverter(audio_raw.get()).convert_to_opus()
+            speaker = self.events_queue.popleft().speaker
+            if end > self.buffer.head:
+                self._cut(speaker, end)
+
+    # keep: bytes before `end` that stay buffered and are sent again with
+    # the next segment of the same speaker
+    def _cut(self, speaker, end, keep=0):
+        overlap = self.carried if speaker == self.carried_speaker else 0
+        self.carried, self.carried_speaker = 0, None
+        if end - self.buffer.head <= overlap:
+            self.buffer.release(end)
+            return
+
+        # the worker copies the audio out, see SpeechSegment.data
+        segment = SpeechSegment.from_buffer(
+            speaker=speaker,
+            buffer=self.buffer,
+            end=end,
+            tr_id=self.tr_counter.next(),
+            overlap=overlap,
+        )
+        keep = min(keep, end - self.buffer.head)
+        self.buffer.release(end - keep)
+        if overlap:
+            segment.overlap_of = self.carried_tr_id
+        if keep > 0:
+            self.carried, self.carried_speaker = keep, speaker
+            self.carried_tr_id = segment.tr_id
+
+        segment = self.governor.pack(segment)
+        if segment is not None:
+            self._enqueue(segment)
+
+    def _enqueue(self, segment: SpeechSegment):
+        self.segments.put(segment)
+        self.enqueued += 1
+
+    # cuts the current speaker turn at the end of the buffered audio, the
+    # turn may go on so the cut is overlapped with the next segment
+    def _flush_cut(self):
+        if self.events_queue and len(self.buffer) > self.carried:
+            self._cut(
+                self.events_queue[0].speaker,
+                self.buffer.tail,
+                keep=self.overlap.overlap_bytes,
+            )
+            self.quiet_bytes = 0
 
-            # DEBUG
-            # with open("output/test.mp3", "ab") as f:
-            #    f.write(opus_audio)
+    # idle: the stream stopped, held short turns are not waited for
+    def flush(self, idle=False):
+        if self.streaming:
+            return
 
-            transcipt_text = self.speech_kit.get(opus_audio)
+        with self.mutex:
+            self._cut_ready()
+            self._flush_cut()
+            for segment in self.governor.expired(force=idle):
+                self._enqueue(segment)
+
+        self.dispatcher.notify(self.lane_key)
+
+    # runs on a dispatcher worker, never concurrently for one RealTimeAudio
+    def _process_segment(self, segment: SpeechSegment):
+        tr = self._transcribe(segment)
+        if tr is not None and self.on_transcription is not None:
+            self.on_transcription(tr)
+
+    # trims leading/trailing silence, None if the segment is silent
+    def _speech_view(self, pcm: bytes) -> Optional[memoryview]:
+        samples = self.vad.samples([pcm])
+
+        self.vad_stats.segments += 1
+        self.vad_stats.total_sec += len(pcm) / PCM_BYTES_PER_SEC
+
+        speech = self.vad.speech_range(samples)
+        if speech is None:
+            self.vad_stats.skipped_segments += 1
+            logger.info(f"VAD: skipped silent segment, {self.vad_stats.as_dict()}")
+            return None
+
+        start, stop = speech
+        self.vad_stats.sent_sec += (stop - start) / PCM_BYTES_PER_SEC
+        return memoryview(pcm)[start:stop]
+
+    def _transcribe(self, segment: SpeechSegment) -> Optional[Transcription]:
+        logger.info(f"Processed {segment.speaker}: {segment.size} bytes")
+
+        transcipt_text = None
+        try:
+            pcm = segment.data()
+            if not pcm:
+                return None
+            speech_view = self._speech_view(pcm)
+            if speech_view is None:
+                return None
+            parts = self.governor.split(speech_view)
+            if len(parts) == 1:
+                transcipt_text = self._recognize(speech_view)
+            else:
+                # encoding is serialized per stream, recognition is not
+                payloads = [self.encode([part]) for part in parts]
+                texts = self.dispatcher.map_parallel(
+                    lambda encoded: self.speech_kit.get(
+                        encoded.payload, encoded.profile
+                    ),
+                    payloads,
+                )
+                transcipt_text = " ".join(text for text in texts if text)
             logger.info(f"Getted transcription {transcipt_text}")
         except Exception as e:
             logger.error(f"Error while getting transcription: {e}")
-            self.timestamp_counter = 0
             return None
 
         if not transcipt_text or transcipt_text == "":
-            self.timestamp_counter = 0
             return None
 
+        prev_tr_id, prev_text = self.last_result
+        self.last_result = (segment.tr_id, transcipt_text)
+        if segment.overlap and prev_tr_id == segment.overlap_of:
+            overlap = self.vad.samples([pcm[: segment.overlap]])
+            transcipt_text = self.overlap.merge(
+                prev_text,
+                transcipt_text,
+                voiced=self.vad.speech_range(overlap) is not None,
+            )
+            if transcipt_text == "":
+                return None
+
         transcription: "Transcription" = {
-            "id": self.tr_counter,
+            "id": segment.tr_id,
             "sp": {
                 "is_final": True,
                 "message": transcipt_text,
-                "speaker": current_speaker.speaker,
+                "speaker": segment.speaker,
             },
         }
-        self.tr_counter += 1
-        self.timestamp_counter = 0
         return transcription
 
+    def _recognize(self, pcm: memoryview) -> Optional[str]:
+        encoded = self.encode([pcm])
+        logger.info(
+            f"Encoded {encoded.pcm_bytes} bytes as {encoded.profile}: "
+            f"{len(encoded.payload)} bytes in {encoded.encode_sec:.3f}s"
+        )
+
+        # DEBUG
+        # with open("output/test.mp3", "ab") as f:
+        #    f.write(encoded.payload)
+
+        return self.speech_kit.get(encoded.payload, encoded.profile)
+
+    def encode(self, pcm_views) -> EncodedAudio:
+        return AudioConverter.encode(pcm_views, self.profile, self.encoder)
+
+    # recorded PCM of [start_ts, end_ts) recording time, e.g. to re-transcribe
+    def read_archive(self, start_ts: float, end_ts: float) -> Optional[bytes]:
+        if self.archive is None:
+            return None
+        return self.archive.read(start_ts, end_ts)
+
+    def stats(self) -> dict:
+        return {
+            "vad": self.vad_stats.as_dict(),
+            "governor": self.governor.stats(),
+            "overlap": self.overlap.stats(),
+            "buffer_dropped": self.buffer.dropped,
+        }
+
+    def close(self):
+        self.flush_timer.cancel(self.lane_key)
+        # the buffered turn and the held short ones are recognized first
+        self.flush(idle=True)
+        if not self.dispatcher.drain(self.lane_key, timeout=CLOSE_DRAIN_SEC):
+            logger.warning(f"RealTimeAudio: {self.lane_key} closed with segments left")
+        self.dispatcher.unregister(self.lane_key)
+        if self.own_flush_timer:
+            self.flush_timer.stop()
+        if self.own_dispatcher:
+            self.dispatcher.stop()
+        if self.encoder is not None:
+            self.encoder.close()
+        if self.archive is not None:
+            self.archive.close()
+        if self.streaming_session is not None:
+            self.streaming_session.close()
+
     """
     def flush_to_transcripts(self) -> list[Transcription]:
         events_to_flush = self.events_queue
@@ -1,5 +1,5 @@
 from typing import Union
-import requests
+from ..http_client import http_client
 from ..utils import wrap_http_err
 
 
@@ -18,11 +18,11 @@ class RecallApiBase:
 
     def recall_post(self, path, json_body):
         url = self._url(path)
-        return wrap_http_err(requests.post(url, headers=self.headers, json=json_body))
+        return wrap_http_err(http_client().post(url, headers=self.headers, json=json_body))
 
     def recall_get(self, path):
         url = self._url(path)
-        return wrap_http_err(requests.get(url, headers=self.headers))
+        return wrap_http_err(http_client().get(url, headers=self.headers))
 
 
 class RecallApi(RecallApiBase):
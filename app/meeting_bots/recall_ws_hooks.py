@@ -4,7 +4,6 @@ from typing import TYPE_CHECKING
 
 import websockets
 from ..logger import Logger
-from .bot import Transcription
 
 
 logger = Logger().get_logger(__name__)
@@ -59,25 +58,44 @@ class RecallWsHooks:
 
         return bot
 
-    """
-    @property
-    def audio_ws_handler_separate(self):
-        async def _audio_ws_handler_separate(websocket, path):
-            async for message in websocket:
+    async def _serve_separate(self, websocket, bot: "Bot"):
+        # every frame is prefixed with the 4-byte participant id
+        while True:
+            try:
+                message = await websocket.recv()
                 if isinstance(message, str):
                     logger.info(f"audio_handler message: {message}")
-                else:
-                    participant_id = int.from_bytes(message[0:4], byteorder="little")
-                    with open(f"output/{participant_id}-output.raw", "ab") as f:
-                        f.write(message[4:])
-                        logger.info(f"wrote message for {participant_id}")
-
-        return _audio_ws_handler_separate
-    """
-
+                    continue
+
+                bot.participants.save_frame(message)
+
+            except websockets.ConnectionClosedOK:
+                break
+            except Exception as e:
+                logger.error("audio_ws_handler got exceptiong: %s", e)
+
+    async def _serve_combined(self, websocket, bot: "Bot", header: dict):
+        real_time_audio = bot.real_time_audio
+        offset = header.get("offset")
+        if offset is not None:
+            real_time_audio.set_audio_offset(float(offset))
+        # TODO: handle not json and not string
+        while True:
+            try:
+                message = await websocket.recv()
+
+                # tts
+                real_time_audio.save_segment(message)
+
+            except websockets.ConnectionClosedOK:
+                break
+            except Exception as e:
+                logger.error("audio_ws_handler got exceptiong: %s", e)
+
+    # serves both combined and separate streams, as told by the header
     @property
-    def audio_ws_handler_combined(self):
-        async def _audio_ws_handler_combined(
+    def audio_ws_handler(self):
+        async def _audio_ws_handler(
             websocket, path
         ):  # audio_handler message: {"protocol_version":1,"bot_id":"a45c0d94-5822-41c5-8794-9be38e359412","recording_id":"c
             # 333ff7f-dcab-4ec1-b39f-00a259488bb5","separate_streams":false,"offset":0.0}
@@ -85,26 +103,19 @@ class RecallWsHooks:
             first_message = await websocket.recv()
             logger.info("audio_ws_handler: first_message: %s", first_message)
 
-            bot = self.get_bot_from_header(first_message, "audio_ws_handler_combined")
+            bot = self.get_bot_from_header(first_message, "audio_ws_handler")
             if bot is None or bot.real_time_audio is None:
                 logger.warning("audio_ws_handler close")
                 await websocket.close()
                 return
-            real_time_audio = bot.real_time_audio
-            # TODO: handle not json and not string
-            while True:
-                try:
-                    message = await websocket.recv()
-
-                    # tts
-                    real_time_audio.save_segment(message)
 
-                except websockets.ConnectionClosedOK:
-                    break
-                except Exception as e:
-                    logger.error("audio_ws_handler got exceptiong: %s", e)
+            header = json.loads(first_message)
+            if header.get("separate_streams"):
+                await self._serve_separate(websocket, bot)
+            else:
+                await self._serve_combined(websocket, bot, header)
 
-        return _audio_ws_handler_combined
+        return _audio_ws_handler
 
     @property
     def speaker_ws_handler(self):
@@ -130,11 +141,12 @@ class RecallWsHooks:
                     speaker = json_message["name"]
                     ts = json_message["timestamp"]
 
-                    current_transciption: Transcription = (
-                        real_time_audio.set_speaker_event(speaker=speaker, unmute_ts=ts)
-                    )
-                    if current_transciption and current_transciption != "":
-                        bot.add_transcription(current_transciption)
+                    user_id = json_message.get("user_id")
+                    if user_id is not None:
+                        bot.participants.set_name(user_id, speaker)
+
+                    # only enqueues, transcriptions reach the bot from the STT dispatcher
+                    real_time_audio.set_speaker_event(speaker=speaker, unmute_ts=ts)
 
                 except websockets.ConnectionClosedOK:
                     break
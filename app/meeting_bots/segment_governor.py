@@ -0,0 +1,103 @@
+import time
+from typing import Optional
+
+from ..audio import PCM_BYTES_PER_SEC, PCM_SAMPLE_WIDTH
+from ..logger import Logger
+from ..vad import VoiceActivityDetector
+from .segment_queue import SpeechSegment
+
+logger = Logger().get_logger(__name__)
+
+# the sync SpeechKit endpoint accepts up to 30 s and 1 MB per request
+SEGMENT_MAX_SEC = 28.0
+SEGMENT_SPLIT_SEARCH_SEC = 6.0
+SEGMENT_MIN_SEC = 1.0
+SEGMENT_MAX_HOLD_SEC = 15.0
+
+
+# Keeps STT requests inside the provider limits and avoids paying a full
+# round trip for tiny turns. Short segments are held back per speaker and
+# packed with the next segment of the same speaker; segments longer than
+# max_sec are split at the quietest frame near the limit.
+class SegmentGovernor:
+    def __init__(
+        self,
+        vad: VoiceActivityDetector,
+        max_sec=SEGMENT_MAX_SEC,
+        search_sec=SEGMENT_SPLIT_SEARCH_SEC,
+        min_sec=SEGMENT_MIN_SEC,
+        max_hold_sec=SEGMENT_MAX_HOLD_SEC,
+    ):
+        self.vad = vad
+        self.max_sec = max_sec
+        self.search_sec = search_sec
+        self.min_sec = min_sec
+        self.max_hold_sec = max_hold_sec
+
+        # speaker -> (held segment, monotonic time it was held)
+        self.pending: dict[str, tuple[SpeechSegment, float]] = {}
+
+        self.packed = 0
+        self.splits = 0
+
+    # a packed segment takes the id of its newest part, so it is not
+    # ordered before the turns of others spoken in between
+    def pack(self, segment: SpeechSegment) -> Optional[SpeechSegment]:
+        held = self.pending.pop(segment.speaker, None)
+        if held is not None:
+            held[0].extend(segment)
+            held[0].tr_id = segment.tr_id
+            segment = held[0]
+            self.packed += 1
+            held_at = held[1]
+        else:
+            held_at = time.monotonic()
+
+        if segment.size < self.min_sec * PCM_BYTES_PER_SEC:
+            self.pending[segment.speaker] = (segment, held_at)
+            return None
+        return segment
+
+    # held segments that waited too long (all of them with force=True)
+    def expired(self, force=False) -> list[SpeechSegment]:
+        now = time.monotonic()
+        ready = [
+            speaker
+            for speaker, (_, held_at) in self.pending.items()
+            if force or now - held_at >= self.max_hold_sec
+        ]
+        return sorted(
+            (self.pending.pop(speaker)[0] for speaker in ready),
+            key=lambda segment: segment.tr_id,
+        )
+
+    def split(self, pcm: memoryview) -> list[memoryview]:
+        max_bytes = int(self.max_sec * PCM_BYTES_PER_SEC)
+        if len(pcm) <= max_bytes:
+            return [pcm]
+
+        samples = self.vad.samples([pcm])
+        energy_db = self.vad.frame_energy_db(samples)
+        frame_bytes = self.vad.frame_len * PCM_SAMPLE_WIDTH
+        max_frames = max_bytes // frame_bytes
+        search_frames = int(self.search_sec * PCM_BYTES_PER_SEC) // frame_bytes
+
+        parts = []
+        start = 0
+        while len(pcm) - start * frame_bytes > max_bytes:
+            lo = start + max_frames - search_frames
+            cut = lo + int(energy_db[lo : start + max_frames].argmin())
+            parts.append(pcm[start * frame_bytes : cut * frame_bytes])
+            start = cut
+        parts.append(pcm[start * frame_bytes :])
+
+        self.splits += 1
+        logger.info(f"SegmentGovernor: split {len(pcm)} bytes into {len(parts)} parts")
+        return parts
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self.pending),
+            "packed": self.packed,
+            "splits": self.splits,
+        }
@@ -0,0 +1,166 @@
+import tempfile
+from collections import deque
+from threading import Lock
+from typing import TYPE_CHECKING, Optional, Union
+
+from strenum import StrEnum
+
+from ..logger import Logger
+
+logger = Logger().get_logger(__name__)
+
+if TYPE_CHECKING:
+    from ..audio import PcmRingBuffer
+
+SEGMENT_QUEUE_SIZE = 8
+
+
+class OverflowPolicy(StrEnum):
+    COALESCE = "coalesce"
+    DROP_OLDEST = "drop_oldest"
+    SPILL = "spill"
+
+
+# PCM bytes, or a (ring buffer, start, end) range not copied out yet
+_Part = Union[bytes, tuple["PcmRingBuffer", int, int]]
+
+
+# A cut speaker turn waiting for recognition. A segment cut from the ring
+# buffer only refers to its range; the worker copies it out in data(), so
+# the websocket loop never copies the audio of a turn.
+class SpeechSegment:
+    def __init__(
+        self, speaker: str, pcm: bytes, start_pos: int, tr_id: int, overlap=0
+    ):
+        self.speaker = speaker
+        self.start_pos = start_pos
+        self.tr_id = tr_id
+        # leading bytes already sent at the end of the previous segment
+        self.overlap = overlap
+        # tr_id of that previous segment
+        self.overlap_of: Optional[int] = None
+        self.size = len(pcm)
+        self._parts: list[_Part] = [pcm]
+        self._spill = None
+
+    @staticmethod
+    def from_buffer(
+        speaker: str, buffer: "PcmRingBuffer", end: int, tr_id: int, overlap=0
+    ) -> "SpeechSegment":
+        segment = SpeechSegment(speaker, b"", buffer.head, tr_id, overlap)
+        segment._parts = [(buffer, buffer.head, end)]
+        segment.size = end - buffer.head
+        return segment
+
+    @property
+    def spilled(self) -> bool:
+        return self._spill is not None
+
+    def spill(self):
+        if self._spill is not None:
+            return
+        pcm = self.data()
+        self._spill = tempfile.TemporaryFile(prefix="segment_")
+        self._spill.write(pcm)
+        self._parts = []
+
+    def data(self) -> bytes:
+        if self._spill is not None:
+            self._spill.seek(0)
+            self._parts = [self._spill.read()]
+            self._spill.close()
+            self._spill = None
+
+        if len(self._parts) != 1 or not isinstance(self._parts[0], bytes):
+            self._parts = [b"".join(map(self._copy, self._parts))]
+            self.size = len(self._parts[0])
+        return self._parts[0]
+
+    def _copy(self, part: _Part) -> bytes:
+        if isinstance(part, bytes):
+            return part
+
+        buffer, start, end = part
+        pcm = buffer.copy(start, end)
+        if pcm is None:
+            logger.warning(
+                f"SpeechSegment: audio of {self.tr_id} was overwritten, "
+                f"lost {end - start} bytes"
+            )
+            return b""
+        return pcm
+
+    # parts without the first `skip` bytes, the overlap sent before
+    def _parts_from(self, skip) -> list[_Part]:
+        if self._spill is not None:
+            self.data()
+
+        first, *rest = self._parts
+        if isinstance(first, bytes):
+            first = first[skip:]
+        else:
+            buffer, start, end = first
+            first = (buffer, min(start + skip, end), end)
+        return [first, *rest]
+
+    def extend(self, other: "SpeechSegment"):
+        if self._spill is not None:
+            self.data()
+        self._parts += other._parts_from(other.overlap)
+        self.size += max(0, other.size - other.overlap)
+
+
+# Bounded FIFO of segments for one bot. The websocket side only puts,
+# a worker pops; `policy` decides what happens when the queue is full.
+class SegmentQueue:
+    def __init__(self, maxsize=SEGMENT_QUEUE_SIZE, policy=OverflowPolicy.COALESCE):
+        self.maxsize = maxsize
+        self.policy = OverflowPolicy(policy)
+        self.segments: deque[SpeechSegment] = deque()
+        self.mutex = Lock()
+
+        self.dropped = 0
+        self.coalesced = 0
+        self.spilled = 0
+
+    def __len__(self):
+        return len(self.segments)
+
+    def put(self, segment: SpeechSegment):
+        with self.mutex:
+            if len(self.segments) < self.maxsize:
+                self.segments.append(segment)
+                return
+
+            if self.policy == OverflowPolicy.SPILL:
+                segment.spill()
+                self.spilled += 1
+                self.segments.append(segment)
+                return
+
+            last = self.segments[-1]
+            if self.policy == OverflowPolicy.COALESCE and last.speaker == segment.speaker:
+                last.extend(segment)
+                self.coalesced += 1
+                return
+
+            dropped = self.segments.popleft()
+            self.dropped += 1
+            self.segments.append(segment)
+            logger.warning(
+                f"SegmentQueue full: dropped {dropped.size} bytes of {dropped.speaker}"
+            )
+
+    def pop(self) -> Optional[SpeechSegment]:
+        with self.mutex:
+            if not self.segments:
+                return None
+            return self.segments.popleft()
+
+    def stats(self) -> dict:
+        return {
+            "depth": len(self.segments),
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "spilled": self.spilled,
+        }
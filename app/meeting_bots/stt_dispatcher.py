@@ -0,0 +1,219 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Condition, Lock, Thread
+from typing import Any, Callable, Hashable, Iterable
+
+from ..logger import Logger
+from .segment_queue import SegmentQueue, SpeechSegment
+
+logger = Logger().get_logger(__name__)
+
+STT_WORKERS = 4
+STT_RATE_LIMIT = 20.0
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.mutex = Lock()
+        self.waits = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        waited = False
+        while True:
+            with self.mutex:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    if waited:
+                        self.waits += 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            waited = True
+            time.sleep(delay)
+
+
+class _Lane:
+    def __init__(self, bot_id, queue: SegmentQueue, handler):
+        self.bot_id = bot_id
+        self.queue = queue
+        self.handler = handler
+        self.busy = False
+        self.processed = 0
+
+
+# Shared STT worker pool. Every RealTimeAudio registers a lane (its segment
+# queue and handler). Workers serve bots round-robin, one segment per turn,
+# and never run two segments of the same lane at once, so a lane's results
+# stay in order. Every recognition takes a token from the provider bucket,
+# a dispatcher without a rate (a local backend) has no bucket.
+class SttDispatcher:
+    def __init__(self, workers=STT_WORKERS, rate=STT_RATE_LIMIT, burst=None):
+        self.cond = Condition()
+        self.lanes: dict[Hashable, _Lane] = {}
+        # bot_id -> lanes of that bot with work and no segment in flight
+        self.ready: dict[str, deque[Hashable]] = {}
+        self.bots: deque[str] = deque()
+        self.bucket = (
+            TokenBucket(rate, burst if burst is not None else rate) if rate else None
+        )
+
+        self.in_flight = 0
+        self.processed = 0
+        self.failed = 0
+        self.stopped = False
+
+        self.workers = [
+            Thread(target=self._work, name=f"stt-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+        # parts of one split segment, see map_parallel
+        self.parts_pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="stt-part"
+        )
+
+    def register(
+        self,
+        lane_key: Hashable,
+        bot_id: str,
+        queue: SegmentQueue,
+        handler: Callable[[SpeechSegment], None],
+    ):
+        with self.cond:
+            self.lanes[lane_key] = _Lane(bot_id, queue, handler)
+
+    def unregister(self, lane_key: Hashable):
+        with self.cond:
+            lane = self.lanes.pop(lane_key, None)
+            if lane is None:
+                return
+            ready = self.ready.get(lane.bot_id)
+            if ready is not None and lane_key in ready:
+                ready.remove(lane_key)
+                if not ready:
+                    self._drop_bot(lane.bot_id)
+
+    # waits until the lane has no queued or running segment
+    def drain(self, lane_key: Hashable, timeout=None) -> bool:
+        def drained():
+            lane = self.lanes.get(lane_key)
+            return lane is None or (not lane.busy and len(lane.queue) == 0)
+
+        with self.cond:
+            return self.cond.wait_for(drained, timeout=timeout)
+
+    # called after segments were put into the lane queue
+    def notify(self, lane_key: Hashable):
+        with self.cond:
+            lane = self.lanes.get(lane_key)
+            if lane is None or lane.busy or len(lane.queue) == 0:
+                return
+            self._mark_ready(lane_key, lane)
+            self.cond.notify()
+
+    def _mark_ready(self, lane_key, lane: _Lane):
+        ready = self.ready.get(lane.bot_id)
+        if ready is None:
+            ready = self.ready[lane.bot_id] = deque()
+            self.bots.append(lane.bot_id)
+        if lane_key not in ready:
+            ready.append(lane_key)
+
+    def _drop_bot(self, bot_id):
+        self.ready.pop(bot_id, None)
+        if bot_id in self.bots:
+            self.bots.remove(bot_id)
+
+    def _next(self):
+        # next bot in turn, then the next ready lane of that bot
+        bot_id = self.bots.popleft()
+        ready = self.ready[bot_id]
+        lane_key = ready.popleft()
+        if ready:
+            self.bots.append(bot_id)
+        else:
+            self.ready.pop(bot_id)
+
+        lane = self.lanes[lane_key]
+        lane.busy = True
+        self.in_flight += 1
+        return lane_key, lane
+
+    def _work(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.stopped or self.bots)
+                if self.stopped:
+                    return
+                lane_key, lane = self._next()
+
+            segment = lane.queue.pop()
+            if segment is not None:
+                self._acquire()
+                try:
+                    lane.handler(segment)
+                    lane.processed += 1
+                except Exception as e:
+                    self.failed += 1
+                    logger.error(f"SttDispatcher: handler failed for {lane_key}: {e}")
+
+            with self.cond:
+                lane.busy = False
+                self.in_flight -= 1
+                if segment is not None:
+                    self.processed += 1
+                if lane_key in self.lanes and len(lane.queue) > 0:
+                    self._mark_ready(lane_key, lane)
+                    self.cond.notify()
+                else:
+                    # wakes drain(), idle workers go back to waiting
+                    self.cond.notify_all()
+
+    # runs fn over items concurrently from inside a handler; the handler
+    # already holds a token for the first item, the rest take their own
+    def map_parallel(self, fn: Callable[[Any], Any], items: Iterable) -> list:
+        def run(i, item):
+            if i > 0:
+                self._acquire()
+            return fn(item)
+
+        futures = [self.parts_pool.submit(run, i, item) for i, item in enumerate(items)]
+        return [future.result() for future in futures]
+
+    def _acquire(self):
+        if self.bucket is not None:
+            self.bucket.acquire()
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+        self.parts_pool.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        with self.cond:
+            per_bot: dict[str, int] = {}
+            for lane in self.lanes.values():
+                per_bot[lane.bot_id] = per_bot.get(lane.bot_id, 0) + len(lane.queue)
+
+            return {
+                "workers": len(self.workers),
+                "in_flight": self.in_flight,
+                "queued": sum(per_bot.values()),
+                "ready_bots": len(self.bots),
+                "processed": self.processed,
+                "failed": self.failed,
+                "rate_limit_waits": self.bucket.waits if self.bucket else 0,
+                "per_bot": per_bot,
+            }
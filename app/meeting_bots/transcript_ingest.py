@@ -0,0 +1,162 @@
+import json
+import re
+from collections import OrderedDict
+from threading import Condition, Thread
+from typing import TYPE_CHECKING
+
+from ..logger import Logger
+
+if TYPE_CHECKING:
+    from .bot_net import BotNet
+
+logger = Logger().get_logger(__name__)
+
+INGEST_DEBOUNCE_SEC = 0.2
+# latest updates waiting to be parsed; when full the oldest partial is
+# dropped, the oldest final only when there is no partial
+INGEST_MAX_PENDING = 1024
+
+_BOT_ID_RE = re.compile(rb'"bot_id"\s*:\s*"([^"]*)"')
+_TR_ID_RE = re.compile(rb'"original_transcript_id"\s*:\s*(\d+)')
+_IS_FINAL_RE = re.compile(rb'"is_final"\s*:\s*(true|false)')
+
+
+# (bot_id, original_transcript_id, is_final) found in the raw body without
+# parsing the words, None when a field is missing or ambiguous
+def _scan(body: bytes):
+    fields = []
+    for regex in (_BOT_ID_RE, _TR_ID_RE, _IS_FINAL_RE):
+        found = regex.findall(body)
+        if len(found) != 1:
+            return None
+        fields.append(found[0])
+    bot_id, tr_id, is_final = fields
+    return bot_id.decode(), int(tr_id), is_final == b"true"
+
+
+# Backs the Recall /transcription webhook. The handler only queues the raw
+# body, keyed by (bot_id, original_transcript_id) from a scan of the raw
+# bytes, and a newer update replaces the queued one. This thread parses the
+# bodies left after a debounce, so superseded partial results are never
+# parsed or turned into transcriptions.
+class TranscriptIngest(Thread):
+    def __init__(
+        self,
+        bot_net: "BotNet",
+        debounce_sec=INGEST_DEBOUNCE_SEC,
+        max_pending=INGEST_MAX_PENDING,
+    ):
+        super().__init__(name="transcript-ingest", daemon=True)
+        self.bot_net = bot_net
+        self.debounce_sec = debounce_sec
+        self.max_pending = max_pending
+        self.cond = Condition()
+        # key -> (is_final, body)
+        self.pending: OrderedDict[tuple, tuple[bool, bytes]] = OrderedDict()
+        self.stopped = False
+
+        self.received = 0
+        self.superseded = 0
+        self.dropped = 0
+        self.added = 0
+        self.start()
+
+    def put(self, body: bytes):
+        scanned = _scan(body)
+        with self.cond:
+            self.received += 1
+            if scanned is None:
+                # parsed in full later, under a key of its own
+                key, is_final = (None, self.received), False
+            else:
+                key, is_final = scanned[:2], scanned[2]
+
+            prev = self.pending.pop(key, None)
+            if prev is not None:
+                self.superseded += 1
+                # a late partial never replaces the final result
+                if prev[0] and not is_final:
+                    self.pending[key] = prev
+                    return
+            self.pending[key] = (is_final, body)
+
+            if len(self.pending) > self.max_pending:
+                drop = next(
+                    (k for k, (final, _) in self.pending.items() if not final),
+                    next(iter(self.pending)),
+                )
+                del self.pending[drop]
+                self.dropped += 1
+                logger.warning(f"TranscriptIngest: queue is full, dropped {drop}")
+            self.cond.notify()
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.stopped:
+                    self.cond.wait()
+                if self.stopped:
+                    return
+                # let the rest of a burst of partials arrive
+                self.cond.wait_for(lambda: self.stopped, self.debounce_sec)
+                batch = [body for _, body in self.pending.values()]
+                self.pending = OrderedDict()
+
+            try:
+                self._ingest(batch)
+            except Exception as e:
+                logger.error(f"TranscriptIngest: failed to ingest batch: {e}")
+
+    def _ingest(self, batch: list[bytes]):
+        from .bot import Transcription  # maybe cyclic
+
+        latest: dict[tuple[str, int], dict] = {}
+        for body in batch:
+            try:
+                data = json.loads(body)["data"]
+                bot_id = data["bot_id"]
+                transcript = data["transcript"]
+                key = (bot_id, transcript["original_transcript_id"])
+            except Exception as e:
+                logger.error(f"TranscriptIngest: bad payload: {e}")
+                continue
+
+            # a late partial never replaces the final result
+            prev = latest.get(key)
+            if prev is not None and prev["is_final"] and not transcript["is_final"]:
+                self.superseded += 1
+                continue
+            if prev is not None:
+                self.superseded += 1
+            latest[key] = transcript
+
+        by_bot: dict[str, list[dict]] = {}
+        for (bot_id, _), transcript in latest.items():
+            by_bot.setdefault(bot_id, []).append(transcript)
+
+        for bot_id, transcripts in by_bot.items():
+            bot = self.bot_net.get_by_bot_id(bot_id=bot_id)
+            if bot is None:
+                bot = self.bot_net.try_restore_bot(bot_id=bot_id)
+            if bot is None:
+                logger.error("No such bot")
+                continue
+
+            for transcript in transcripts:
+                bot.add_transcription(Transcription.from_recall_resp(transcript))
+            self.added += len(transcripts)
+
+    def stats(self) -> dict:
+        with self.cond:
+            return {
+                "received": self.received,
+                "pending": len(self.pending),
+                "superseded": self.superseded,
+                "dropped": self.dropped,
+                "added": self.added,
+            }
@@ -0,0 +1,196 @@
+import os
+import struct
+import zlib
+from threading import Condition, Lock, Thread
+from typing import TYPE_CHECKING, Optional
+
+from ..logger import Logger
+
+if TYPE_CHECKING:
+    from .bot import SpeakerTranscription
+
+logger = Logger().get_logger(__name__)
+
+TRANSCRIPT_LOG_FSYNC_SEC = 1.0
+
+LOG_TRANSCRIPTION = 1
+LOG_SUMMARY = 2
+
+# crc32 of the rest of the record
+_LOG_CRC = struct.Struct("<I")
+# kind, tr_id, is_final, speaker and text lengths; speaker and text follow as
+# utf-8. A summary record keeps the next transcript id in tr_id.
+_LOG_HEADER = struct.Struct("<BqBHI")
+
+
+class LogReplay:
+    def __init__(self):
+        self.summ: Optional[str] = None
+        self.t: dict[int, "SpeakerTranscription"] = {}
+        self.next_tr_id = 0
+        self.records = 0
+
+
+# Makes the logs durable in batches: appends only mark a log dirty, this
+# thread fsyncs every dirty log at most once per interval and sleeps while
+# nothing is written.
+class _LogSyncer(Thread):
+    def __init__(self, interval=TRANSCRIPT_LOG_FSYNC_SEC):
+        super().__init__(name="transcript-log-sync", daemon=True)
+        self.interval = interval
+        self.cond = Condition()
+        self.dirty: set["TranscriptLog"] = set()
+        self.start()
+
+    def mark(self, log: "TranscriptLog"):
+        with self.cond:
+            if not self.dirty:
+                self.cond.notify()
+            self.dirty.add(log)
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.dirty:
+                    self.cond.wait()
+                # let more appends join this fsync
+                self.cond.wait(self.interval)
+                dirty, self.dirty = self.dirty, set()
+            for log in dirty:
+                log.sync()
+
+
+_syncer: Optional[_LogSyncer] = None
+_syncer_mutex = Lock()
+
+
+def _log_syncer() -> _LogSyncer:
+    global _syncer
+    with _syncer_mutex:
+        if _syncer is None:
+            _syncer = _LogSyncer()
+        return _syncer
+
+
+# Append-only per bot log of transcriptions and summary drops. A summary
+# drop makes everything before it obsolete, so the log is rewritten to that
+# single record and stays as long as the transcript since the last summary.
+class TranscriptLog:
+    def __init__(self, bot_id, root):
+        self.path = os.path.join(root, f"{bot_id}.wal")
+        self.mutex = Lock()
+        self.syncer = _log_syncer()
+
+        os.makedirs(root, exist_ok=True)
+        self._file = open(self.path, "ab")
+
+    @staticmethod
+    def _record(kind, tr_id, is_final, speaker: str, text: str) -> bytes:
+        speaker_b, text_b = speaker.encode(), text.encode()
+        body = (
+            _LOG_HEADER.pack(kind, tr_id, is_final, len(speaker_b), len(text_b))
+            + speaker_b
+            + text_b
+        )
+        return _LOG_CRC.pack(zlib.crc32(body)) + body
+
+    def append(self, tr_id: int, sp: "SpeakerTranscription"):
+        record = TranscriptLog._record(
+            LOG_TRANSCRIPTION, tr_id, sp["is_final"], sp["speaker"], sp["message"]
+        )
+        with self.mutex:
+            if self._file is None:
+                return
+            self._file.write(record)
+        self.syncer.mark(self)
+
+    # `kept`: transcriptions the summary does not cover, written after it
+    def drop_to_summ(
+        self,
+        summary: str,
+        next_tr_id: int,
+        kept: Optional[list[tuple[int, "SpeakerTranscription"]]] = None,
+    ):
+        records = [TranscriptLog._record(LOG_SUMMARY, next_tr_id, False, "", summary)]
+        for tr_id, sp in kept or []:
+            records.append(
+                TranscriptLog._record(
+                    LOG_TRANSCRIPTION, tr_id, sp["is_final"], sp["speaker"], sp["message"]
+                )
+            )
+        with self.mutex:
+            if self._file is None:
+                return
+            self._file.close()
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.writelines(records)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._file = open(self.path, "ab")
+
+    def sync(self):
+        with self.mutex:
+            if self._file is None:
+                return
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self, remove=False):
+        with self.mutex:
+            if self._file is None:
+                return
+            self._file.close()
+            self._file = None
+            if remove:
+                os.remove(self.path)
+
+    # a torn record at the end, left by a crash mid-write, ends the replay
+    # and is cut off so new records follow the last good one
+    @staticmethod
+    def replay(bot_id, root) -> LogReplay:
+        path = os.path.join(root, f"{bot_id}.wal")
+        replay = LogReplay()
+        if not os.path.exists(path):
+            return replay
+
+        with open(path, "rb") as f:
+            data = f.read()
+        view = memoryview(data)
+
+        pos = 0
+        header_end = _LOG_CRC.size + _LOG_HEADER.size
+        while pos + header_end <= len(data):
+            (crc,) = _LOG_CRC.unpack_from(data, pos)
+            kind, tr_id, is_final, speaker_len, text_len = _LOG_HEADER.unpack_from(
+                data, pos + _LOG_CRC.size
+            )
+            start = pos + header_end
+            end = start + speaker_len + text_len
+            if end > len(data) or zlib.crc32(view[pos + _LOG_CRC.size : end]) != crc:
+                break
+
+            speaker = data[start : start + speaker_len].decode()
+            text = data[start + speaker_len : end].decode()
+            if kind == LOG_SUMMARY:
+                replay.summ = text
+                replay.t = {}
+                replay.next_tr_id = max(replay.next_tr_id, tr_id)
+            else:
+                # a late partial never replaces a final, as in FullTranscription
+                if is_final or not replay.t.get(tr_id, {}).get("is_final"):
+                    replay.t[tr_id] = {
+                        "message": text,
+                        "is_final": bool(is_final),
+                        "speaker": speaker,
+                    }
+                replay.next_tr_id = max(replay.next_tr_id, tr_id + 1)
+            replay.records += 1
+            pos = end
+
+        if pos < len(data):
+            logger.warning(f"TranscriptLog: {bot_id}: cut {len(data) - pos} torn bytes")
+            with open(path, "r+b") as f:
+                f.truncate(pos)
+        return replay
@@ -0,0 +1,114 @@
+import bisect
+from array import array
+from typing import Iterator
+
+
+class TranscriptEntry:
+    __slots__ = ("tr_id", "speaker", "is_final", "message")
+
+    def __init__(self, tr_id: int, speaker: int, is_final: bool, message: str):
+        self.tr_id = tr_id
+        self.speaker = speaker
+        self.is_final = is_final
+        self.message = message
+
+
+# Transcript entries ordered by id in parallel typed arrays. Speaker names
+# are interned into a table and stored as indexes, messages live in one
+# utf-8 arena addressed by offset and length. A replaced entry (a partial
+# result updated) leaves its old message behind until the arena is compacted.
+class TranscriptStore:
+    def __init__(self):
+        self.ids = array("q")
+        self.speakers = array("I")
+        self.finals = bytearray()
+        self.offsets = array("Q")
+        self.lengths = array("I")
+        self.arena = bytearray()
+        self.garbage = 0
+
+        self.speaker_names: list[str] = []
+        self.speaker_index: dict[str, int] = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def intern(self, speaker: str) -> int:
+        index = self.speaker_index.get(speaker)
+        if index is None:
+            index = len(self.speaker_names)
+            self.speaker_names.append(speaker)
+            self.speaker_index[speaker] = index
+        return index
+
+    # position of tr_id, -1 if it is not stored
+    def find(self, tr_id: int) -> int:
+        pos = bisect.bisect_left(self.ids, tr_id)
+        if pos < len(self.ids) and self.ids[pos] == tr_id:
+            return pos
+        return -1
+
+    # stores or replaces an entry, returns its position
+    def put(self, tr_id: int, speaker: str, is_final: bool, message: str) -> int:
+        encoded = message.encode()
+        speaker_idx = self.intern(speaker)
+
+        if not self.ids or tr_id > self.ids[-1]:
+            pos = len(self.ids)
+            self.ids.append(tr_id)
+            self.speakers.append(speaker_idx)
+            self.finals.append(is_final)
+            self.offsets.append(len(self.arena))
+            self.lengths.append(len(encoded))
+        else:
+            pos = bisect.bisect_left(self.ids, tr_id)
+            if self.ids[pos] == tr_id:
+                self.garbage += self.lengths[pos]
+                self.speakers[pos] = speaker_idx
+                self.finals[pos] = is_final
+                self.offsets[pos] = len(self.arena)
+                self.lengths[pos] = len(encoded)
+            else:
+                self.ids.insert(pos, tr_id)
+                self.speakers.insert(pos, speaker_idx)
+                self.finals.insert(pos, is_final)
+                self.offsets.insert(pos, len(self.arena))
+                self.lengths.insert(pos, len(encoded))
+        self.arena += encoded
+
+        if self.garbage > len(self.arena) // 2:
+            self.compact()
+        return pos
+
+    def is_final(self, pos: int) -> bool:
+        return bool(self.finals[pos])
+
+    # position of the first partial from `start` on, len() if there is none
+    def first_partial(self, start=0) -> int:
+        pos = self.finals.find(0, start)
+        return len(self.finals) if pos < 0 else pos
+
+    def message(self, pos: int) -> str:
+        offset = self.offsets[pos]
+        return self.arena[offset : offset + self.lengths[pos]].decode()
+
+    def speaker_name(self, speaker: int) -> str:
+        return self.speaker_names[speaker]
+
+    def entry(self, pos: int) -> TranscriptEntry:
+        return TranscriptEntry(
+            self.ids[pos], self.speakers[pos], self.is_final(pos), self.message(pos)
+        )
+
+    def entries(self, start=0, end=None) -> Iterator[TranscriptEntry]:
+        for pos in range(start, len(self.ids) if end is None else end):
+            yield self.entry(pos)
+
+    def compact(self):
+        arena = bytearray()
+        for pos in range(len(self.ids)):
+            offset = self.offsets[pos]
+            self.offsets[pos] = len(arena)
+            arena += self.arena[offset : offset + self.lengths[pos]]
+        self.arena = arena
+        self.garbage = 0
@@ -0,0 +1,62 @@
+from threading import Event, Lock
+from typing import Callable, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class _Call:
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+# Concurrent calls with the same key share one execution of `fn`: the first
+# caller runs it, the others wait and get its result or its exception. A
+# call made after it finished runs again.
+class SingleFlight:
+    def __init__(self):
+        self.mutex = Lock()
+        self.calls: dict[Hashable, _Call] = {}
+
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        with self.mutex:
+            call = self.calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.shared += 1
+                leader = False
+            else:
+                call = _Call()
+                self.calls[key] = call
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.mutex:
+                self.calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    def stats(self) -> dict:
+        with self.mutex:
+            return {
+                "in_flight": len(self.calls),
+                "executed": self.executed,
+                "shared": self.shared,
+            }
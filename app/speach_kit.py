@@ -1,7 +1,12 @@
 import os
-import requests
-from typing import Optional
+from bisect import bisect_right
+from abc import ABC, abstractmethod
+from queue import Empty, Full, Queue
+from threading import Event, Lock, Thread
+from typing import Callable, Optional
 
+from .audio import EncodingProfile
+from .http_client import http_client
 from .logger import Logger
 from dotenv import load_dotenv
 
@@ -13,22 +18,54 @@ YA_SPEECH_TO_TEXT_URL = (
 )
 
 
-class YaSpeechToText:
+def _recognize_url(profile: Optional[EncodingProfile]) -> str:
+    if profile is None:
+        return YA_SPEECH_TO_TEXT_URL
+    return (
+        f"{YA_SPEECH_TO_TEXT_URL}&format={profile.audio_format}"
+        f"&sampleRateHertz={profile.sample_rate}"
+    )
+
+
+# Sync recognition of one encoded segment. Backends that only take raw PCM
+# set `pcm_only`, the bot then encodes segments with an LPCM profile.
+class SpeechRecognizer(ABC):
+    pcm_only = False
+
+    @abstractmethod
+    def get(
+        self, audio_data: bytes, profile: Optional[EncodingProfile] = None
+    ) -> Optional[str]:
+        pass
+
+    def get_batch(
+        self, items: list[tuple[bytes, Optional[EncodingProfile]]]
+    ) -> list[Optional[str]]:
+        return [self.get(audio_data, profile) for audio_data, profile in items]
+
+    def close(self):
+        pass
+
+
+class YaSpeechToText(SpeechRecognizer):
     def __init__(self, api_key, ffmpeg_path):
         self.api_key = api_key
 
         load_dotenv()
         os.environ["FFMPEG_PATH"] = ffmpeg_path
 
-    def get(self, opus_audio_data: bytes) -> Optional[str]:
+    # audio_data is Ogg/Opus unless an encoding profile says otherwise
+    def get(
+        self, audio_data: bytes, profile: Optional[EncodingProfile] = None
+    ) -> Optional[str]:
         headers = {
             "Authorization": self.api_key,
-            "Content-Type": "audio/ogg",
+            "Content-Type": profile.content_type if profile else "audio/ogg",
         }
 
         try:
-            response = requests.post(
-                YA_SPEECH_TO_TEXT_URL, data=opus_audio_data, headers=headers
+            response = http_client().post(
+                _recognize_url(profile), data=audio_data, headers=headers
             )
         except Exception as e:
             logger.error("failed to get tr from YaSpeechKit: %s", e)
@@ -39,3 +76,234 @@ class YaSpeechToText:
 
         logger.error("failed to get tr from YaSpeechKit: response: %s", response.json())
         return None
+
+
+YA_STT_GRPC_ENDPOINT = "stt.api.cloud.yandex.net:443"
+STREAMING_QUEUE_CHUNKS = 500
+STREAMING_RECONNECT_SEC = 1.0
+# how often the request generator of a stream checks that the stream ended
+STREAMING_POLL_SEC = 0.1
+
+
+class StreamingResult:
+    utterance: int
+    text: str
+    is_final: bool
+    start_pos: int
+
+    def __init__(self, utterance, text, is_final, start_pos):
+        self.utterance = utterance
+        self.text = text
+        self.is_final = is_final
+        self.start_pos = start_pos
+
+
+# SpeechKit v3 RecognizeStreaming over gRPC. `endpoint` and `secure` can point
+# the client at a local stand-in server implementing the same service.
+class YaStreamingSpeechToText:
+    def __init__(
+        self,
+        api_key,
+        endpoint=YA_STT_GRPC_ENDPOINT,
+        secure=True,
+        sample_rate=16000,
+        language_code="ru-RU",
+    ):
+        self.api_key = api_key
+        self.endpoint = endpoint
+        self.secure = secure
+        self.sample_rate = sample_rate
+        self.language_code = language_code
+
+    def open_session(
+        self, on_result: Callable[[StreamingResult], None]
+    ) -> "StreamingRecognitionSession":
+        session = StreamingRecognitionSession(self, on_result)
+        session.start()
+        return session
+
+    def channel(self):
+        import grpc
+
+        if self.secure:
+            return grpc.secure_channel(self.endpoint, grpc.ssl_channel_credentials())
+        return grpc.insecure_channel(self.endpoint)
+
+    def session_options(self, stt_pb2):
+        return stt_pb2.StreamingRequest(
+            session_options=stt_pb2.StreamingOptions(
+                recognition_model=stt_pb2.RecognitionModelOptions(
+                    audio_format=stt_pb2.AudioFormatOptions(
+                        raw_audio=stt_pb2.RawAudio(
+                            audio_encoding=stt_pb2.RawAudio.LINEAR16_PCM,
+                            sample_rate_hertz=self.sample_rate,
+                            audio_channel_count=1,
+                        )
+                    ),
+                    text_normalization=stt_pb2.TextNormalizationOptions(
+                        text_normalization=stt_pb2.TextNormalizationOptions.TEXT_NORMALIZATION_ENABLED,
+                        profanity_filter=False,
+                        literature_text=False,
+                    ),
+                    language_restriction=stt_pb2.LanguageRestrictionOptions(
+                        restriction_type=stt_pb2.LanguageRestrictionOptions.WHITELIST,
+                        language_code=[self.language_code],
+                    ),
+                    audio_processing_type=stt_pb2.RecognitionModelOptions.REAL_TIME,
+                )
+            )
+        )
+
+
+# One bidirectional stream per bot. PCM is fed from the audio websocket,
+# results are delivered to `on_result` from the session thread. The server
+# closes streams after a few minutes, so the session reconnects until closed.
+# A chunk gRPC took for a stream that ended before the server reported
+# receiving it is sent again as the first chunk of the next stream.
+class StreamingRecognitionSession(Thread):
+    def __init__(
+        self, client: YaStreamingSpeechToText, on_result: Callable[[StreamingResult], None]
+    ):
+        self.client = client
+        self.on_result = on_result
+        self.chunks: Queue[Optional[bytes]] = Queue(maxsize=STREAMING_QUEUE_CHUNKS)
+        self.closed = Event()
+
+        # byte position, among the chunks sent, of the first chunk of the
+        # current stream
+        self.fed_pos = 0
+        self.stream_base_pos = 0
+        # taken from the queue and not yet known to be sent; the position up
+        # to which the server reported audio as received
+        self.pending: Optional[bytes] = None
+        self.received_pos = 0
+        # chunks dropped by feed() still advance the caller's stream: sent
+        # positions at which audio was dropped and the total dropped so far
+        self.queued_pos = 0
+        self.gap_pos: list[int] = []
+        self.gap_total: list[int] = []
+        self.gap_mutex = Lock()
+        # utterance numbers are global for the session, server final indexes
+        # restart with every stream
+        self.utterance = 0
+        self.finals: dict[int, int] = {}
+
+        Thread.__init__(self, daemon=True)
+
+    def feed(self, pcm: bytes):
+        try:
+            self.chunks.put_nowait(pcm)
+            self.queued_pos += len(pcm)
+        except Full:
+            logger.warning("streaming stt: queue is full, dropping audio chunk")
+            with self.gap_mutex:
+                total = self.gap_total[-1] if self.gap_total else 0
+                if self.gap_pos and self.gap_pos[-1] == self.queued_pos:
+                    self.gap_total[-1] = total + len(pcm)
+                else:
+                    self.gap_pos.append(self.queued_pos)
+                    self.gap_total.append(total + len(pcm))
+
+    # bytes dropped before the sent position `pos`
+    def _dropped_before(self, pos) -> int:
+        with self.gap_mutex:
+            i = bisect_right(self.gap_pos, pos)
+            return self.gap_total[i - 1] if i > 0 else 0
+
+    def close(self):
+        self.closed.set()
+        try:
+            self.chunks.put_nowait(None)
+        except Full:
+            pass
+
+    # the generator of a stream that failed may still be waiting for a
+    # chunk, it stops taking them once `ended` is set
+    def _requests(self, stt_pb2, ended: Event):
+        yield self.client.session_options(stt_pb2)
+        while not ended.is_set() and not self.closed.is_set():
+            chunk = self.pending
+            if chunk is None:
+                try:
+                    chunk = self.chunks.get(timeout=STREAMING_POLL_SEC)
+                except Empty:
+                    continue
+                if chunk is None:
+                    return
+                self.fed_pos += len(chunk)
+                self.pending = chunk
+            yield stt_pb2.StreamingRequest(chunk=stt_pb2.AudioChunk(data=chunk))
+            # gRPC asks for the next request once the previous one is sent
+            self.pending = None
+
+    # position among the chunks sent
+    def _sent_pos(self, ms) -> int:
+        return self.stream_base_pos + int(ms * self.client.sample_rate // 1000) * 2
+
+    # stream position of the caller, including the dropped chunks
+    def _ms_to_pos(self, ms) -> int:
+        pos = self._sent_pos(ms)
+        return pos + self._dropped_before(pos)
+
+    def _handle(self, resp):
+        self.received_pos = max(
+            self.received_pos, self._sent_pos(resp.audio_cursors.received_data_ms)
+        )
+        event = resp.WhichOneof("Event")
+        if event == "partial":
+            alternatives = resp.partial.alternatives
+            utterance, is_final = self.utterance, False
+        elif event == "final":
+            alternatives = resp.final.alternatives
+            utterance, is_final = self.utterance, True
+            self.finals[resp.audio_cursors.final_index] = utterance
+            self.utterance += 1
+        elif event == "final_refinement":
+            alternatives = resp.final_refinement.normalized_text.alternatives
+            utterance = self.finals.pop(
+                resp.final_refinement.final_index, self.utterance - 1
+            )
+            is_final = True
+        else:
+            return
+
+        if not alternatives or not alternatives[0].text:
+            return
+
+        self.on_result(
+            StreamingResult(
+                utterance=utterance,
+                text=alternatives[0].text,
+                is_final=is_final,
+                start_pos=self._ms_to_pos(alternatives[0].start_time_ms),
+            )
+        )
+
+    def run(self):
+        from yandex.cloud.ai.stt.v3 import stt_pb2, stt_service_pb2_grpc
+
+        metadata = (("authorization", self.client.api_key),)
+        while not self.closed.is_set():
+            # a pending chunk is replayed at the start of the new stream
+            # unless the server got it before the old one ended
+            pending = self.pending
+            if pending is not None and self.received_pos >= self.fed_pos:
+                self.pending = pending = None
+            self.stream_base_pos = self.fed_pos - (len(pending) if pending else 0)
+            self.finals = {}
+            ended = Event()
+            try:
+                with self.client.channel() as channel:
+                    stub = stt_service_pb2_grpc.RecognizerStub(channel)
+                    responses = stub.RecognizeStreaming(
+                        self._requests(stt_pb2, ended), metadata=metadata
+                    )
+                    for resp in responses:
+                        self._handle(resp)
+            except Exception as e:
+                logger.error("streaming stt: stream failed: %s", e)
+            finally:
+                ended.set()
+
+            # longer than STREAMING_POLL_SEC, the old generator is done
+            self.closed.wait(STREAMING_RECONNECT_SEC)
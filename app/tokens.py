@@ -0,0 +1,86 @@
+import math
+import re
+
+# YandexGPT models share one context for the prompt and the completion
+GPT_CONTEXT_TOKENS = 8000
+GPT_MAX_OUTPUT_TOKENS = 2000
+# role and message framing the API adds around every message
+GPT_MESSAGE_OVERHEAD_TOKENS = 8
+
+# the tokenizer is a SentencePiece BPE trained mostly on Russian: a word
+# takes a token per few letters, every punctuation mark takes its own one
+# and long numbers are split into groups of digits. The estimate is on the
+# high side of what the API reports for our transcripts.
+WORD_RE = re.compile(r"[^\W\d_]+|\d+|[^\w\s]|_")
+LETTERS_PER_TOKEN = 4
+DIGITS_PER_TOKEN = 3
+
+
+def estimate_tokens(text: str) -> int:
+    tokens = 0
+    for match in WORD_RE.finditer(text):
+        word = match.group()
+        if word[0].isdigit():
+            tokens += math.ceil(len(word) / DIGITS_PER_TOKEN)
+        elif word[0].isalpha():
+            tokens += math.ceil(len(word) / LETTERS_PER_TOKEN)
+        else:
+            tokens += 1
+    return tokens
+
+
+# tokens left for the user message next to `system_prompt` and a completion
+# of up to `max_tokens`
+def input_budget(system_prompt: str, max_tokens=GPT_MAX_OUTPUT_TOKENS) -> int:
+    return (
+        GPT_CONTEXT_TOKENS
+        - max_tokens
+        - estimate_tokens(system_prompt)
+        - 2 * GPT_MESSAGE_OVERHEAD_TOKENS
+    )
+
+
+# completion size for requests that rewrite their input, e.g. styling
+def response_budget(text: str, ratio=1.0, extra=10) -> int:
+    return min(GPT_MAX_OUTPUT_TOKENS, int(estimate_tokens(text) * ratio) + extra)
+
+
+# pieces of at most `budget` tokens cut at line breaks, or at spaces inside
+# a line that does not fit by itself
+def split_to_budget(text: str, budget: int) -> list[str]:
+    pieces: list[str] = []
+    current: list[str] = []
+    used = 0
+
+    def push():
+        nonlocal current, used
+        if current:
+            pieces.append("".join(current))
+        current, used = [], 0
+
+    for line in text.splitlines(keepends=True):
+        tokens = estimate_tokens(line)
+        if tokens > budget:
+            push()
+            for word in line.split(" "):
+                word_tokens = estimate_tokens(word) + 1
+                if used + word_tokens > budget:
+                    push()
+                current.append(f"{word} ")
+                used += word_tokens
+            push()
+            continue
+
+        if used + tokens > budget:
+            push()
+        current.append(line)
+        used += tokens
+    push()
+
+    return [piece.strip() for piece in pieces if piece.strip()]
+
+
+# the head of `text` that fits the budget
+def trim_to_budget(text: str, budget: int) -> str:
+    pieces = split_to_budget(text, budget)
+    return pieces[0] if pieces else ""
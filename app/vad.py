@@ -0,0 +1,119 @@
+from typing import Optional
+
+import numpy as np
+
+from .audio import PCM_FRAME_RATE, PCM_SAMPLE_WIDTH
+from .logger import Logger
+
+logger = Logger().get_logger(__name__)
+
+VAD_FRAME_MS = 30
+VAD_MIN_ENERGY_DB = -50.0
+VAD_MAX_THRESHOLD_DB = -35.0
+VAD_NOISE_MARGIN_DB = 9.0
+VAD_STRONG_MARGIN_DB = 18.0
+VAD_MAX_ZCR = 0.35
+VAD_HANGOVER_MS = 300
+VAD_PREROLL_MS = 60
+VAD_MIN_SPEECH_MS = 90
+
+
+class VadStats:
+    def __init__(self):
+        self.segments = 0
+        self.skipped_segments = 0
+        self.total_sec = 0.0
+        self.sent_sec = 0.0
+
+    @property
+    def saved_sec(self) -> float:
+        return self.total_sec - self.sent_sec
+
+    def as_dict(self) -> dict:
+        return {
+            "segments": self.segments,
+            "skipped_segments": self.skipped_segments,
+            "total_sec": round(self.total_sec, 2),
+            "sent_sec": round(self.sent_sec, 2),
+            "saved_sec": round(self.saved_sec, 2),
+        }
+
+
+# Energy + zero-crossing rate VAD over fixed frames of s16le mono PCM.
+# A frame is speech when it is loud enough above the segment noise floor and
+# is not noise-like (high ZCR) unless it is clearly loud. The speech mask is
+# then smoothed with a hangover so short pauses inside phrases are kept.
+class VoiceActivityDetector:
+    def __init__(
+        self,
+        frame_ms=VAD_FRAME_MS,
+        min_energy_db=VAD_MIN_ENERGY_DB,
+        max_threshold_db=VAD_MAX_THRESHOLD_DB,
+        noise_margin_db=VAD_NOISE_MARGIN_DB,
+        strong_margin_db=VAD_STRONG_MARGIN_DB,
+        max_zcr=VAD_MAX_ZCR,
+        hangover_ms=VAD_HANGOVER_MS,
+        preroll_ms=VAD_PREROLL_MS,
+        min_speech_ms=VAD_MIN_SPEECH_MS,
+    ):
+        self.frame_len = PCM_FRAME_RATE * frame_ms // 1000
+        self.min_energy_db = min_energy_db
+        self.max_threshold_db = max_threshold_db
+        self.noise_margin_db = noise_margin_db
+        self.strong_margin_db = strong_margin_db
+        self.max_zcr = max_zcr
+        self.hangover = max(1, hangover_ms // frame_ms)
+        self.preroll = preroll_ms // frame_ms
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+
+    @staticmethod
+    def samples(pcm_views) -> np.ndarray:
+        parts = [np.frombuffer(v, dtype="<i2") for v in pcm_views]
+        if not parts:
+            return np.zeros(0, dtype="<i2")
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def frame_energy_db(self, samples: np.ndarray) -> np.ndarray:
+        n_frames = len(samples) // self.frame_len
+        frames = samples[: n_frames * self.frame_len].reshape(n_frames, -1)
+        power = np.mean(np.square(frames, dtype=np.float64), axis=1)
+        return 10.0 * np.log10(power / (32768.0**2) + 1e-12)
+
+    def speech_mask(self, samples: np.ndarray) -> np.ndarray:
+        n_frames = len(samples) // self.frame_len
+        if n_frames == 0:
+            return np.zeros(0, dtype=bool)
+
+        frames = samples[: n_frames * self.frame_len].reshape(n_frames, -1)
+        energy_db = self.frame_energy_db(samples)
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (
+            self.frame_len - 1
+        )
+
+        noise_floor = float(np.percentile(energy_db, 10))
+        threshold = min(noise_floor + self.noise_margin_db, self.max_threshold_db)
+        threshold = max(self.min_energy_db, threshold)
+
+        strong = energy_db > threshold + self.strong_margin_db
+        return (energy_db > threshold) & ((zcr < self.max_zcr) | strong)
+
+    def smooth(self, mask: np.ndarray) -> np.ndarray:
+        # hangover: keep `hangover` frames after and a short pre-roll before
+        # every speech frame
+        kernel = np.ones(self.hangover + self.preroll, dtype=np.int32)
+        smoothed = np.convolve(mask.astype(np.int32), kernel)
+        return smoothed[self.preroll : self.preroll + len(mask)] > 0
+
+    def speech_range(self, samples: np.ndarray) -> Optional[tuple[int, int]]:
+        mask = self.speech_mask(samples)
+        if np.count_nonzero(mask) < self.min_speech_frames:
+            return None
+
+        idx = np.flatnonzero(self.smooth(mask))
+        start = int(idx[0]) * self.frame_len
+        end = (int(idx[-1]) + 1) * self.frame_len
+        # the tail that does not fill a whole frame follows the last frame
+        if idx[-1] == len(mask) - 1:
+            end = len(samples)
+        return start * PCM_SAMPLE_WIDTH, end * PCM_SAMPLE_WIDTH
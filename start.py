@@ -1,5 +1,8 @@
 import pathlib
 from app.config import Config
+from app.gpt_utils import GPT_COMPLETION_URL
+from app.http_client import http_client
+from app.speach_kit import YA_SPEECH_TO_TEXT_URL
 from app.http import create_flask_app
 from app.utils import stop_all_threads, start_all_threads, make_ssl_context
 
@@ -18,6 +21,16 @@ if __name__ == "__main__":
     try:
         bot_net = BotNet(config.bot_config)
 
+        # open keep-alive connections before the first bot needs them
+        http_client().prewarm(
+            [
+                GPT_COMPLETION_URL,
+                YA_SPEECH_TO_TEXT_URL,
+                bot_net.recall_api.url.format(path="/"),
+                config.bot_config["SUMM_GETTER_ENDP"],
+            ]
+        )
+
         scheduler = Scheduler()
 
         ssl_context = make_ssl_context(
@@ -27,7 +40,7 @@ if __name__ == "__main__":
         ws_server_1 = WebSocketServer(
             "0.0.0.0",
             config.env.AUDIO_WS_PORT,
-            bot_net.ws_hooks.audio_ws_handler_combined,
+            bot_net.ws_hooks.audio_ws_handler,
             reboot_time=None,
             ssl_context=ssl_context,
         )
@@ -56,3 +69,5 @@ if __name__ == "__main__":
     finally:
         if "threads" in locals():
             stop_all_threads(threads)
+        if "bot_net" in locals():
+            bot_net.close()
@@ -0,0 +1,20 @@
+import pytest
+
+from app.meeting_bots.compaction import compact
+
+
+@pytest.mark.parametrize(
+    "message, compacted",
+    [
+        ("ээ ну мм да", "ну да"),
+        ("я думаю я думаю что да", "я думаю что да"),
+        ("это это важно это это важно", "это это важно"),
+        ("это это важно", "это это важно"),
+        ("да да", "да да"),
+        ("100 100 рублей", "100 100 рублей"),
+        ("100 рублей 100 рублей", "100 рублей 100 рублей"),
+        ("давайте начнём, давайте начнём  сейчас", "давайте начнём сейчас"),
+    ],
+)
+def test_compact(message, compacted):
+    assert compact(message) == compacted
@@ -0,0 +1,34 @@
+from app.meeting_bots.bot import FullTranscription
+
+
+def sp(message, is_final=True, speaker="Anna"):
+    return {"message": message, "is_final": is_final, "speaker": speaker}
+
+
+def test_partial_becomes_final_without_rebuild():
+    transcription = FullTranscription()
+    transcription.add(0, sp("привет"))
+    transcription.add(1, sp("добрый", is_final=False, speaker="Boris"))
+    transcription.add(2, sp("как дела"))
+    assert transcription.dialogue() == ("", "Anna: привет как дела\n")
+    assert transcription.built == 1
+
+    transcription.add(1, sp("добрый день", speaker="Boris"))
+    assert not transcription.stale
+    assert transcription.dialogue() == (
+        "",
+        "Anna: привет\nBoris: добрый день\nAnna: как дела\n",
+    )
+    assert transcription.built == 3
+
+
+def test_change_inside_prefix_rebuilds():
+    transcription = FullTranscription()
+    transcription.add(1, sp("один"))
+    transcription.add(3, sp("три", speaker="Boris"))
+    transcription.dialogue()
+
+    transcription.add(2, sp("два", speaker="Boris"))
+    assert transcription.stale
+    assert transcription.dialogue() == ("", "Anna: один\nBoris: два три\n")
+    assert not transcription.stale
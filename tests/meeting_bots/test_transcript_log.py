@@ -0,0 +1,109 @@
+import os
+
+from app.meeting_bots.bot import FullTranscription
+from app.meeting_bots.transcript_log import TranscriptLog
+
+
+def sp(message, is_final=True, speaker="Anna"):
+    return {"message": message, "is_final": is_final, "speaker": speaker}
+
+
+def test_round_trip(tmp_path):
+    log = TranscriptLog("bot", tmp_path)
+    log.append(0, sp("привет", is_final=False))
+    log.append(0, sp("привет всем"))
+    log.append(1, sp("добрый день", speaker="Boris"))
+    log.close()
+
+    replay = TranscriptLog.replay("bot", tmp_path)
+    assert replay.summ is None
+    assert replay.records == 3
+    assert replay.next_tr_id == 2
+    assert replay.t == {0: sp("привет всем"), 1: sp("добрый день", speaker="Boris")}
+
+
+def test_torn_tail_is_truncated(tmp_path):
+    log = TranscriptLog("bot", tmp_path)
+    log.append(0, sp("первая"))
+    log.append(1, sp("вторая"))
+    log.close()
+
+    path = os.path.join(tmp_path, "bot.wal")
+    size = os.path.getsize(path)
+    with open(path, "r+b") as f:
+        f.truncate(size - 3)
+
+    replay = TranscriptLog.replay("bot", tmp_path)
+    assert replay.t == {0: sp("первая")}
+    assert replay.next_tr_id == 1
+
+    # the torn record is cut, new records follow the last good one
+    log = TranscriptLog("bot", tmp_path)
+    log.append(1, sp("снова"))
+    log.close()
+    assert TranscriptLog.replay("bot", tmp_path).t == {0: sp("первая"), 1: sp("снова")}
+
+
+def test_late_partial_keeps_final(tmp_path):
+    log = TranscriptLog("bot", tmp_path)
+    log.append(0, sp("готово"))
+    log.append(0, sp("гот", is_final=False))
+    log.close()
+
+    assert TranscriptLog.replay("bot", tmp_path).t == {0: sp("готово")}
+
+
+def test_late_partial_rejected_by_transcription():
+    transcription = FullTranscription()
+    assert transcription.add(0, sp("готово"))
+    assert not transcription.add(0, sp("гот", is_final=False))
+    assert transcription.dialogue() == ("", "Anna: готово\n")
+
+
+def test_summary_drop(tmp_path):
+    log = TranscriptLog("bot", tmp_path)
+    log.append(0, sp("до сводки"))
+    log.append(1, sp("тоже до сводки"))
+    log.drop_to_summ("сводка", 2)
+    log.append(2, sp("после сводки"))
+    log.close()
+
+    replay = TranscriptLog.replay("bot", tmp_path)
+    assert replay.summ == "сводка"
+    assert replay.t == {2: sp("после сводки")}
+    assert replay.next_tr_id == 3
+    assert replay.records == 2
+
+
+def test_close_remove(tmp_path):
+    log = TranscriptLog("bot", tmp_path)
+    log.append(0, sp("текст"))
+    log.close(remove=True)
+
+    assert not os.path.exists(os.path.join(tmp_path, "bot.wal"))
+    assert TranscriptLog.replay("bot", tmp_path).records == 0
+
+
+def test_summary_drop_keeps_later_entries(tmp_path):
+    log = TranscriptLog("bot", tmp_path)
+    log.drop_to_summ("сводка", 3, [(3, sp("после", is_final=False))])
+    log.close()
+
+    replay = TranscriptLog.replay("bot", tmp_path)
+    assert replay.summ == "сводка"
+    assert replay.t == {3: sp("после", is_final=False)}
+    assert replay.next_tr_id == 4
+
+
+def test_drop_keeps_finals_after_snapshot():
+    transcription = FullTranscription()
+    transcription.add(0, sp("один"))
+    transcription.add(1, sp("два", is_final=False))
+    version, _, dialogue = transcription.snapshot()
+    assert dialogue == "Anna: один\n"
+
+    transcription.add(2, sp("три", speaker="Boris"))
+    kept = transcription.drop_to_summ("сводка", version)
+
+    assert kept == [(1, sp("два", is_final=False)), (2, sp("три", speaker="Boris"))]
+    assert transcription.dialogue() == ("сводка", "Boris: три\n")
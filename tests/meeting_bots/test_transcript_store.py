@@ -0,0 +1,61 @@
+from app.meeting_bots.transcript_store import TranscriptStore
+
+
+def dump(store: TranscriptStore):
+    return [
+        (e.tr_id, store.speaker_name(e.speaker), e.is_final, e.message)
+        for e in store.entries()
+    ]
+
+
+def test_out_of_order_put():
+    store = TranscriptStore()
+    assert store.put(5, "Anna", True, "пять") == 0
+    assert store.put(1, "Boris", True, "один") == 0
+    assert store.put(3, "Anna", False, "три") == 1
+    assert store.put(7, "Boris", True, "семь") == 3
+
+    assert dump(store) == [
+        (1, "Boris", True, "один"),
+        (3, "Anna", False, "три"),
+        (5, "Anna", True, "пять"),
+        (7, "Boris", True, "семь"),
+    ]
+    assert store.find(3) == 1
+    assert store.find(4) == -1
+    assert store.speaker_names == ["Anna", "Boris"]
+
+
+def test_replace_entry():
+    store = TranscriptStore()
+    store.put(1, "Anna", False, "прив")
+    store.put(2, "Boris", True, "да")
+    assert store.put(1, "Anna", True, "привет всем") == 0
+
+    assert len(store) == 2
+    assert dump(store) == [(1, "Anna", True, "привет всем"), (2, "Boris", True, "да")]
+    assert store.garbage == len("прив".encode())
+
+
+def test_compact():
+    store = TranscriptStore()
+    store.put(1, "Anna", True, "первая фраза")
+    store.put(2, "Boris", False, "втор")
+    before = dump(store)
+    store.put(2, "Boris", False, "вторая")
+    store.compact()
+
+    assert store.garbage == 0
+    assert len(store.arena) == len("первая фраза".encode()) + len("вторая".encode())
+    assert dump(store) == [before[0], (2, "Boris", False, "вторая")]
+
+
+def test_compact_on_garbage():
+    store = TranscriptStore()
+    store.put(1, "Anna", False, "")
+    for i in range(1, 20):
+        store.put(1, "Anna", False, "слово " * i)
+
+    # the arena never keeps more garbage than live messages
+    assert store.garbage <= len(store.arena) // 2
+    assert dump(store) == [(1, "Anna", False, "слово " * 19)]
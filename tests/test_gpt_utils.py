@@ -0,0 +1,71 @@
+import pytest
+
+from app import gpt_utils
+from app.gpt_cache import GptCache
+
+
+class Response:
+    def __init__(self, text, status):
+        self.body = {
+            "result": {
+                "alternatives": [{"message": {"text": text}, "status": status}]
+            }
+        }
+
+    def json(self):
+        return self.body
+
+
+class Client:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def post(self, url, **kwargs):
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+class Click:
+    def insert_new_summaraize(self, *args):
+        pass
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = GptCache()
+    monkeypatch.setattr(gpt_utils, "gpt_cache", lambda: cache)
+    monkeypatch.setattr(gpt_utils, "click_client", Click())
+    return cache
+
+
+def send(client, monkeypatch):
+    monkeypatch.setattr(gpt_utils, "http_client", lambda: client)
+    return gpt_utils.send_request_to_gpt("текст", "model", "промпт", "key", 0)
+
+
+def test_final_answer_is_cached(cache, monkeypatch):
+    client = Client(Response("Итог встречи", gpt_utils.GPT_FINAL_STATUS))
+    assert send(client, monkeypatch) == "Итог встречи"
+    assert send(client, monkeypatch) == "Итог встречи"
+    assert client.calls == 1
+
+
+def test_empty_answer_is_retried(cache, monkeypatch):
+    client = Client(
+        Response("Простите. Давайте сменим тему", gpt_utils.GPT_FINAL_STATUS),
+        Response("Итог встречи", gpt_utils.GPT_FINAL_STATUS),
+    )
+    assert send(client, monkeypatch) == ""
+    assert send(client, monkeypatch) == "Итог встречи"
+    assert client.calls == 2
+
+
+def test_truncated_answer_is_retried(cache, monkeypatch):
+    client = Client(
+        Response("Итог", "ALTERNATIVE_STATUS_TRUNCATED_FINAL"),
+        Response("Итог встречи", gpt_utils.GPT_FINAL_STATUS),
+    )
+    assert send(client, monkeypatch) == "Итог"
+    assert send(client, monkeypatch) == "Итог встречи"
+    assert cache.stats()["misses"] == 2
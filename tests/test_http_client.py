@@ -0,0 +1,51 @@
+import asyncio
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+import pytest
+
+from app.http_client import HttpClient
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = (self.headers.get("Cookie") or "").encode()
+        self.send_response(200)
+        self.send_header("Set-Cookie", "session=1; Path=/")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+
+
+def test_sync_keeps_no_cookies(url):
+    client = HttpClient()
+    assert [client.get(url).text for _ in range(3)] == ["", "", ""]
+    assert client.stats()[url[:-1]]["handshakes"] == 1
+
+
+def test_async_shares_connections_and_keeps_no_cookies(url):
+    client = HttpClient()
+
+    async def run():
+        try:
+            return [(await client.aget(url)).text for _ in range(3)]
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(run()) == ["", "", ""]
+    stats = client.stats()[url[:-1]]
+    assert stats["requests"] == 3
+    assert stats["handshakes"] == 1
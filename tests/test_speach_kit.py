@@ -0,0 +1,90 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+
+import pytest
+
+grpc = pytest.importorskip("grpc")
+stt_pb2 = pytest.importorskip("yandex.cloud.ai.stt.v3.stt_pb2")
+stt_service_pb2_grpc = pytest.importorskip(
+    "yandex.cloud.ai.stt.v3.stt_service_pb2_grpc"
+)
+
+from app import speach_kit
+from app.speach_kit import YaStreamingSpeechToText
+
+CHUNK = bytes(3200)  # 100 ms of 16 kHz s16le
+
+
+def final(text, index, received):
+    return stt_pb2.StreamingResponse(
+        final=stt_pb2.AlternativeUpdate(
+            alternatives=[stt_pb2.Alternative(text=text, start_time_ms=0)]
+        ),
+        audio_cursors=stt_pb2.AudioCursors(
+            final_index=index, received_data_ms=received // 32
+        ),
+    )
+
+
+# A stand-in for the SpeechKit v3 Recognizer. The first stream ends after
+# `first_chunks` chunks, the next one recognizes everything until the
+# client closes it. Every stream answers with one final for its audio.
+class FakeRecognizer(stt_service_pb2_grpc.RecognizerServicer):
+    def __init__(self, first_chunks):
+        self.first_chunks = first_chunks
+        self.received: list[int] = []
+        self.first_done = Event()
+
+    def RecognizeStreaming(self, request_iterator, context):
+        stream = len(self.received)
+        self.received.append(0)
+        assert next(request_iterator).WhichOneof("Event") == "session_options"
+        for request in request_iterator:
+            self.received[stream] += len(request.chunk.data)
+            if stream == 0 and self.received[0] == self.first_chunks * len(CHUNK):
+                break
+
+        yield final(f"stream {stream}", 0, self.received[stream])
+        if stream == 0:
+            self.first_done.set()
+
+
+@pytest.fixture
+def recognizer(monkeypatch):
+    monkeypatch.setattr(speach_kit, "STREAMING_RECONNECT_SEC", 0.3)
+    servicer = FakeRecognizer(first_chunks=3)
+    server = grpc.server(ThreadPoolExecutor(max_workers=4))
+    stt_service_pb2_grpc.add_RecognizerServicer_to_server(servicer, server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+    yield servicer, YaStreamingSpeechToText(
+        api_key="key", endpoint=f"127.0.0.1:{port}", secure=False
+    )
+    server.stop(None)
+
+
+def test_reconnect_keeps_audio_and_positions(recognizer):
+    servicer, client = recognizer
+    results = []
+    session = client.open_session(results.append)
+
+    for _ in range(3):
+        session.feed(CHUNK)
+    assert servicer.first_done.wait(5)
+    # the generator of the ended stream is still waiting for audio
+    time.sleep(0.02)
+    for _ in range(7):
+        session.feed(CHUNK)
+
+    deadline = time.monotonic() + 5
+    while sum(servicer.received) < 10 * len(CHUNK) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    session.close()
+    session.join(5)
+
+    assert servicer.received == [3 * len(CHUNK), 7 * len(CHUNK)]
+    assert [(r.utterance, r.text, r.is_final, r.start_pos) for r in results] == [
+        (0, "stream 0", True, 0),
+        (1, "stream 1", True, 3 * len(CHUNK)),
+    ]